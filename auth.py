@@ -1,13 +1,11 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-import schemas, models, config
-from dependencies import get_db
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import schemas, models, config, hashing
+from hashing import hash_pool
+from dependencies import get_db, run_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
@@ -16,17 +14,35 @@ ALGORITHM = config.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.hash_password(password)
+
+# bcrypt runs on the hashing process pool so login bursts never occupy request workers
+async def get_password_hash_async(password: str):
+    return await hash_pool.run(hashing.hash_password, password)
+
+def get_credentials(db: Session, login: str):
+    credentials = db.query(models.Users.login, models.Users.hashed_password).filter(models.Users.login == login).first()
+    # End the read transaction so the connection goes back to the pool while bcrypt runs
+    db.rollback()
+    return credentials
+
+def set_password_hash(db: Session, login: str, hashed_password: str):
+    db.query(models.Users).filter(models.Users.login == login).update({"hashed_password": hashed_password})
+    db.commit()
 
-def authenticate_user(db: Session, login: str, password: str):
-    user = db.query(models.Users).filter(models.Users.login == login).first()
+async def authenticate_user(db: Session, login: str, password: str):
+    user = await run_db(db, get_credentials, login)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await hash_pool.run(hashing.verify_password, password, user.hashed_password):
         return False
+    # Upgrade hashes made with an older BCRYPT_ROUNDS while we still hold the plain password
+    if hashing.needs_rehash(user.hashed_password):
+        hashed_password = await get_password_hash_async(password)
+        await run_db(db, set_password_hash, user.login, hashed_password)
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
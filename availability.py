@@ -0,0 +1,113 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import config, models
+
+# Appointments are stored as naive local times of the barbershop, in BARBER_TIMEZONE
+BARBER_TIMEZONE = ZoneInfo(getattr(config, "BARBER_TIMEZONE", "America/Sao_Paulo"))
+# Opening hours shared by every barber; weekdays follow date.weekday() (0 = Monday)
+BARBER_OPENING_TIME = time.fromisoformat(getattr(config, "BARBER_OPENING_TIME", "09:00"))
+BARBER_CLOSING_TIME = time.fromisoformat(getattr(config, "BARBER_CLOSING_TIME", "19:00"))
+BARBER_WORKDAYS = frozenset(getattr(config, "BARBER_WORKDAYS", (0, 1, 2, 3, 4, 5)))
+APPOINTMENT_SLOT_MINUTES = getattr(config, "APPOINTMENT_SLOT_MINUTES", 30)
+APPOINTMENT_MAX_MINUTES = getattr(config, "APPOINTMENT_MAX_MINUTES", 240)
+AVAILABILITY_MAX_DAYS = getattr(config, "AVAILABILITY_MAX_DAYS", 31)
+
+MAX_DURATION = timedelta(minutes=APPOINTMENT_MAX_MINUTES)
+
+# Timestamps sent with an offset ("...Z", "...-03:00") are converted to the barbershop's
+# local time; naive ones are taken as local already
+def local_datetime(value: datetime):
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(BARBER_TIMEZONE).replace(tzinfo=None)
+
+# Validation error for a booking, or None when it fits the opening hours
+def check_interval(start_at: datetime, end_at: datetime):
+    start_at, end_at = local_datetime(start_at), local_datetime(end_at)
+    if end_at <= start_at:
+        return "end_at must be after start_at"
+    if end_at - start_at > MAX_DURATION:
+        return f"Appointments cannot be longer than {APPOINTMENT_MAX_MINUTES} minutes"
+    day = start_at.date()
+    if day.weekday() not in BARBER_WORKDAYS:
+        return "The barbershop is closed on this day"
+    if start_at < datetime.combine(day, BARBER_OPENING_TIME) or end_at > datetime.combine(day, BARBER_CLOSING_TIME):
+        return "Appointment is outside opening hours"
+    return None
+
+# Rows overlapping [start, end): start_at < end AND end_at > start. Since no appointment is
+# longer than MAX_DURATION, start_at >= start - MAX_DURATION is implied, which bounds the
+# (id_barber, start_at) index scan on both sides instead of reading every earlier row.
+def overlapping(start: datetime, end: datetime):
+    start, end = local_datetime(start), local_datetime(end)
+    appointments = models.Appointments
+    return (
+        appointments.start_at >= start - MAX_DURATION,
+        appointments.start_at < end,
+        appointments.end_at > start,
+    )
+
+# Busy intervals per barber, sorted and merged; one range query for all the barbers
+def busy_intervals(db: Session, barber_ids: list, start: datetime, end: datetime):
+    appointments = models.Appointments
+    rows = db.execute(
+        select(appointments.id_barber, appointments.start_at, appointments.end_at)
+        .where(appointments.id_barber.in_(barber_ids), *overlapping(start, end))
+        .order_by(appointments.id_barber, appointments.start_at)
+    )
+    busy = defaultdict(list)
+    for id_barber, start_at, end_at in rows:
+        intervals = busy[id_barber]
+        if intervals and start_at <= intervals[-1][1]:
+            if end_at > intervals[-1][1]:
+                intervals[-1] = (intervals[-1][0], end_at)
+        else:
+            intervals.append((start_at, end_at))
+    return busy
+
+def opening_windows(date_from: date, date_to: date):
+    windows = []
+    day = date_from
+    while day <= date_to:
+        if day.weekday() in BARBER_WORKDAYS:
+            windows.append((datetime.combine(day, BARBER_OPENING_TIME), datetime.combine(day, BARBER_CLOSING_TIME)))
+        day += timedelta(days=1)
+    return windows
+
+# Start times of every free slot of `duration` on a grid of `step` from each opening.
+# Windows and busy intervals are both sorted, so one forward sweep over the two lists
+# finds all the slots: O(slots + appointments) per barber.
+def free_slots(windows: list, busy: list, duration: timedelta, step: timedelta):
+    slots = []
+    i = 0
+    for opening, closing in windows:
+        slot = opening
+        while slot + duration <= closing:
+            while i < len(busy) and busy[i][1] <= slot:
+                i += 1
+            if i < len(busy) and busy[i][0] < slot + duration:
+                # Jump to the first grid point at or after the end of the blocking appointment
+                slot += -((slot - busy[i][1]) // step) * step
+                continue
+            slots.append(slot)
+            slot += step
+    return slots
+
+# The requested barbers that exist, or every barber (up to `limit`) when none are given
+def existing_barbers(db: Session, barber_ids: list | None, limit: int):
+    query = select(models.Barber.id_barber).order_by(models.Barber.id_barber)
+    if barber_ids:
+        query = query.where(models.Barber.id_barber.in_(barber_ids))
+    return list(db.scalars(query.limit(limit)))
+
+def availability(db: Session, barber_ids: list | None, date_from: date, date_to: date, duration: int = APPOINTMENT_SLOT_MINUTES, limit: int = 1000):
+    barber_ids = existing_barbers(db, barber_ids, limit)
+    windows = opening_windows(date_from, date_to)
+    if not windows or not barber_ids:
+        return {barber_id: [] for barber_id in barber_ids}
+    busy = busy_intervals(db, barber_ids, windows[0][0], windows[-1][1])
+    length, step = timedelta(minutes=duration), timedelta(minutes=APPOINTMENT_SLOT_MINUTES)
+    return {barber_id: free_slots(windows, busy.get(barber_id, []), length, step) for barber_id in barber_ids}
@@ -0,0 +1,583 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import config
+
+# Load generator for every route in main.py, run in-process over ASGI.
+#
+#   python benchmark.py --clients 20000 --concurrency 16 --requests 300
+#   python benchmark.py --database-url postgresql://localhost/siscpa_bench --compare benchmark_results/<old>.json
+#
+# The app is pointed at the benchmark database before it is imported, seeded with
+# the requested volumes, then each route is driven in turn by --concurrency
+# authenticated clients. Per route it reports p50/p95/p99 latency, requests per
+# second and SQL statements per request, and writes the results as JSON so runs on
+# different commits can be diffed with --compare.
+
+FIRST_NAMES = ["ana", "bruno", "carla", "diego", "eduarda", "felipe", "gabriela", "henrique", "isabela", "joão", "larissa", "marcos"]
+LAST_NAMES = ["souza", "oliveira", "santos", "pereira", "lima", "costa", "ribeiro", "almeida", "carvalho", "gomes"]
+PAYMENT_METHODS = ["pix", "cartao", "dinheiro", "boleto"]
+PASSWORD = "benchmark"
+
+IMPORT_TIME_BUDGET_MS = 1000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark every API route in-process")
+    parser.add_argument("--database-url", default="sqlite:///benchmark.db")
+    parser.add_argument("--async-db", action="store_true", help="run the app with DB_ASYNC enabled")
+    parser.add_argument("--sql-profile", action="store_true", help="run with the SQL profiler on and store its report with the results")
+    parser.add_argument("--replica-url", help="read replica of --database-url that GET routes read from; seeding only writes to the primary")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--adresses-per-client", type=int, default=1)
+    parser.add_argument("--subscriptions-per-client", type=int, default=2)
+    parser.add_argument("--barbers", type=int, default=50)
+    parser.add_argument("--appointments-per-barber", type=int, default=200, help="booked over the four weeks around today")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--routes", nargs="*", help='only run these routes, e.g. "GET /adress/"')
+    parser.add_argument("--no-seed", action="store_true", help="reuse an already seeded database")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables before seeding")
+    parser.add_argument("--output-dir", default="benchmark_results")
+    parser.add_argument("--compare", help="previous results file to diff against")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check-statements", action="store_true", help="exit non-zero when a write route exceeds its SQL statement budget")
+    parser.add_argument("--serialization-rows", type=int, default=10000, help="rows per response in the list serialization benchmark, 0 to skip")
+    parser.add_argument("--import-runs", type=int, default=5, help="fresh interpreters timed importing the app module, 0 to skip")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS, help="exit non-zero when `import main` takes longer")
+    return parser.parse_args()
+
+#------
+#SEEDING
+#------
+
+def seed(engine, args):
+    import models, migrations, reporting
+    from sqlalchemy import insert, select
+    from hashing import hash_password
+
+    if args.reset:
+        models.Base.metadata.drop_all(bind=engine)
+        migrations.schema_migrations.drop(bind=engine, checkfirst=True)
+    migrations.upgrade(engine)
+    with engine.connect() as conn:
+        if conn.execute(select(models.Clients.id_client).limit(1)).first() is not None:
+            raise SystemExit("benchmark database is not empty; pass --reset to recreate it or --no-seed to reuse it")
+    rng = random.Random(args.seed)
+    hashed_password = hash_password(PASSWORD)
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Users), [
+            {"login": f"bench{i}", "hashed_password": hashed_password, "position": "bench"} for i in range(args.users)
+        ])
+        conn.execute(insert(models.Barber), [{"name": f"Barbeiro {i}"} for i in range(args.barbers)])
+    chunk = 10000
+    for start in range(0, args.clients, chunk):
+        with engine.begin() as conn:
+            # Client n gets CPF n, which the scenarios rely on to address seeded rows
+            ids = conn.execute(insert(models.Clients).returning(models.Clients.id_client, sort_by_parameter_order=True), [{
+                "cpf": f"{n:011d}",
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "phone": f"2199{n:07d}"[:12],
+            } for n in range(start + 1, min(start + chunk, args.clients) + 1)]).scalars().all()
+            if args.adresses_per_client:
+                conn.execute(insert(models.Adress), [{
+                    "logradouro": f"Rua {rng.randint(1, 500)}",
+                    "number": str(rng.randint(1, 2000)),
+                    "neighborhood": f"Bairro {rng.randint(1, 40)}",
+                    "city": rng.choice(["Rio de Janeiro", "Niterói", "São Gonçalo", "Duque de Caxias"]),
+                    "complement": "",
+                    "id_client": i,
+                } for i in ids for _ in range(args.adresses_per_client)])
+            if args.subscriptions_per_client:
+                rows = []
+                for i in ids:
+                    for _ in range(args.subscriptions_per_client):
+                        start_date = today - timedelta(days=rng.randint(0, 400))
+                        duration = rng.choice([30, 90, 180, 365])
+                        rows.append({
+                            "start_date": start_date,
+                            "duration": duration,
+                            "payment_method": rng.choice(PAYMENT_METHODS),
+                            "end_date": start_date + timedelta(days=duration),
+                            "id_client": i,
+                        })
+                conn.execute(insert(models.Subscriptions), rows)
+    if args.appointments_per_barber:
+        slots = _appointment_slots(date.today() - timedelta(days=14), 28)
+        with engine.begin() as conn:
+            conn.execute(insert(models.Appointments), [{
+                "id_barber": barber_id,
+                "id_client": rng.randint(1, args.clients),
+                "start_at": start_at,
+                "end_at": start_at + timedelta(minutes=30),
+            } for barber_id in range(1, args.barbers + 1) for start_at in sorted(rng.sample(slots, min(args.appointments_per_barber, len(slots))))])
+    # Seeded rows bypass crud, so the reporting summaries are computed once at the end
+    with engine.begin() as conn:
+        reporting.rebuild(conn)
+
+# Every 30-minute slot start inside opening hours over `days` days from `first`
+def _appointment_slots(first: date, days: int):
+    from availability import opening_windows
+    slots = []
+    for opening, closing in opening_windows(first, first + timedelta(days=days - 1)):
+        start_at = opening
+        while start_at + timedelta(minutes=30) <= closing:
+            slots.append(start_at)
+            start_at += timedelta(minutes=30)
+    return slots
+
+#------
+#SCENARIOS
+#------
+
+# Shared state the scenarios draw ids and unique values from
+class Context:
+    def __init__(self, args, token: str):
+        self.args = args
+        self.token = token
+        self.rng = random.Random(args.seed)
+        self.counter = 0
+        self.disposable = {}
+        self.free_slots = {}
+        self.sql_profile = None
+
+    def unique(self):
+        self.counter += 1
+        return self.counter
+
+    # Seeding inserts clients in CPF order into empty tables, so id n has CPF n
+    def client_id(self):
+        return self.rng.randint(1, self.args.clients)
+
+    def cpf(self, client_id: int | None = None):
+        return f"{client_id or self.client_id():011d}"
+
+    def new_cpf(self):
+        return f"9{self.args.seed:02d}{os.getpid() % 1000:03d}{self.unique():05d}"[-11:]
+
+def _client_payload(ctx):
+    return {"cpf": ctx.new_cpf(), "name": f"bench client {ctx.counter}", "phone": "21999999999"}
+
+def _subscription_payload(ctx):
+    start = date.today()
+    return {"start_date": start.isoformat(), "duration": 30, "payment_method": "pix", "end_date": (start + timedelta(days=30)).isoformat(), "id_client": ctx.client_id()}
+
+def _adress_payload(ctx):
+    return {"logradouro": "Rua Bench", "number": str(ctx.unique()), "neighborhood": "Centro", "city": "Rio de Janeiro", "complement": "", "id_client": ctx.client_id()}
+
+# Disposable rows for DELETE scenarios, created straight in the database before the run
+def _make_disposable(kind):
+    def setup(ctx, engine, n):
+        import models
+        from sqlalchemy import insert
+        if kind == "clients":
+            model, pk, rows = models.Clients, "id_client", [_client_payload(ctx) for _ in range(n)]
+        elif kind == "subscriptions":
+            model, pk, rows = models.Subscriptions, "id_subscription", [
+                {**_subscription_payload(ctx), "start_date": date.today(), "end_date": date.today()} for _ in range(n)
+            ]
+        elif kind == "adress":
+            model, pk, rows = models.Adress, "id_adress", [_adress_payload(ctx) for _ in range(n)]
+        elif kind == "appointments":
+            model, pk, rows = models.Appointments, "id_appointment", [_appointment_payload(ctx, days_ahead=500) for _ in range(n)]
+        else:
+            model, pk, rows = models.Barber, "id_barber", [{"name": f"disposable {i}"} for i in range(n)]
+        with engine.begin() as conn:
+            ids = conn.execute(insert(model).returning(getattr(model, pk), sort_by_parameter_order=True), rows).scalars().all()
+        ctx.disposable[kind] = iter(ids)
+    return setup
+
+def _patch_client(ctx):
+    client_id = ctx.client_id()
+    return f"/client/{client_id}", {"json": {"cpf": ctx.cpf(client_id), "name": "patched", "phone": "21977777777"}}
+
+def _csv_upload(ctx):
+    lines = ["cpf,name,phone"] + [f"{ctx.new_cpf()},csv bench,21999999999" for _ in range(100)]
+    return {"files": {"file": ("clients.csv", "\n".join(lines), "text/csv")}}
+
+# Distinct slots from `days_ahead` on, past the seeded appointments, so bookings never conflict
+def _appointment_payload(ctx, days_ahead: int = 60):
+    if days_ahead not in ctx.free_slots:
+        ctx.free_slots[days_ahead] = iter(_appointment_slots(date.today() + timedelta(days=days_ahead), 365))
+    start_at = next(ctx.free_slots[days_ahead])
+    return {"id_barber": 1, "id_client": ctx.client_id(), "start_at": start_at, "end_at": start_at + timedelta(minutes=30)}
+
+def _appointment_json(ctx):
+    payload = _appointment_payload(ctx)
+    return {**payload, "start_at": payload["start_at"].isoformat(), "end_at": payload["end_at"].isoformat()}
+
+# The reset route wipes the profile, so the report kept with the results is taken before it runs
+def _snapshot_sql_profile(ctx, engine, n):
+    from profiler import sql_profile
+    if ctx.args.sql_profile:
+        ctx.sql_profile = sql_profile.report()
+
+def _batch_ids(ctx, n: int = 100):
+    return {"ids": [ctx.client_id() for _ in range(n)]}
+
+def _day(days: int):
+    return (date.today() + timedelta(days=days)).isoformat()
+
+# (method, route path) -> (request builder, optional setup). Builders return (url, httpx kwargs).
+SCENARIOS = {
+    ("POST", "/register"): (lambda ctx: ("/register", {"json": {"login": f"u{ctx.unique()}x{time.time_ns() % 10**6}"[:30], "password": PASSWORD, "position": "bench"}}), None),
+    ("POST", "/login"): (lambda ctx: ("/login", {"data": {"username": "bench0", "password": PASSWORD}}), None),
+    ("GET", "/verify-token/{token}"): (lambda ctx: (f"/verify-token/{ctx.token}", {}), None),
+    ("GET", "/me"): (lambda ctx: ("/me", {}), None),
+    ("POST", "/register_client"): (lambda ctx: ("/register_client", {"json": _client_payload(ctx)}), None),
+    ("PUT", "/client"): (lambda ctx: ("/client", {"json": {"cpf": ctx.cpf(), "name": "upserted", "phone": "21988888888"}}), None),
+    ("GET", "/client/{cpf}"): (lambda ctx: (f"/client/{ctx.cpf()}", {}), None),
+    ("POST", "/clients/import"): (lambda ctx: ("/clients/import", {"json": [_client_payload(ctx) for _ in range(100)]}), None),
+    ("POST", "/clients/import/csv"): (lambda ctx: ("/clients/import/csv", _csv_upload(ctx)), None),
+    ("GET", "/clients/"): (lambda ctx: ("/clients/", {"params": {"limit": 100}}), None),
+    ("GET", "/clients/search"): (lambda ctx: ("/clients/search", {"params": {"q": ctx.rng.choice(FIRST_NAMES)[:4]}}), None),
+    ("GET", "/client/{cpf}/profile"): (lambda ctx: (f"/client/{ctx.cpf()}/profile", {}), None),
+    ("GET", "/client/"): (lambda ctx: ("/client/", {"params": {"name": "upserted"}}), None),
+    ("PATCH", "/client/{client_id}"): (lambda ctx: _patch_client(ctx), None),
+    ("DELETE", "/client/{client_id}"): (lambda ctx: (f"/client/{next(ctx.disposable['clients'])}", {}), _make_disposable("clients")),
+    ("POST", "/subscriptions"): (lambda ctx: ("/subscriptions", {"json": _subscription_payload(ctx)}), None),
+    ("GET", "/subscriptions"): (lambda ctx: ("/subscriptions", {"params": {"limit": 100}}), None),
+    ("GET", "/subscriptions/active"): (lambda ctx: ("/subscriptions/active", {"params": {"limit": 100}}), None),
+    ("GET", "/subscriptions/expiring"): (lambda ctx: ("/subscriptions/expiring", {"params": {"days": 7, "limit": 100}}), None),
+    ("GET", "/subscriptions/expired"): (lambda ctx: ("/subscriptions/expired", {"params": {"since": _day(-30), "limit": 100}}), None),
+    ("GET", "/subscriptions/client/{client_id}/current"): (lambda ctx: (f"/subscriptions/client/{ctx.client_id()}/current", {}), None),
+    ("GET", "/subscription/{subscription_id}"): (lambda ctx: (f"/subscription/{ctx.client_id()}", {}), None),
+    ("GET", "/subscriptions/client/{client_id}"): (lambda ctx: (f"/subscriptions/client/{ctx.client_id()}", {}), None),
+    ("PATCH", "/subscription/{subscription_id}"): (lambda ctx: (f"/subscription/{ctx.client_id()}", {"json": _subscription_payload(ctx)}), None),
+    ("DELETE", "/subscriptions/{subscription_id}"): (lambda ctx: (f"/subscriptions/{next(ctx.disposable['subscriptions'])}", {}), _make_disposable("subscriptions")),
+    ("POST", "/adress"): (lambda ctx: ("/adress", {"json": _adress_payload(ctx)}), None),
+    ("GET", "/adress/{adress_id}"): (lambda ctx: (f"/adress/{ctx.client_id()}", {}), None),
+    ("GET", "/adress/"): (lambda ctx: ("/adress/", {"params": {"limit": 100}}), None),
+    ("GET", "/adress/client/{client_id}"): (lambda ctx: (f"/adress/client/{ctx.client_id()}", {}), None),
+    ("PATCH", "/adress/{adress_id}"): (lambda ctx: (f"/adress/{ctx.client_id()}", {"json": _adress_payload(ctx)}), None),
+    ("DELETE", "/adress/{adress_id}"): (lambda ctx: (f"/adress/{next(ctx.disposable['adress'])}", {}), _make_disposable("adress")),
+    ("POST", "/barber/"): (lambda ctx: ("/barber/", {"json": {"name": f"Barbeiro bench {ctx.unique()}"}}), None),
+    ("GET", "/barber/{barber_id}"): (lambda ctx: (f"/barber/{ctx.rng.randint(1, ctx.args.barbers)}", {}), None),
+    ("GET", "/barber/"): (lambda ctx: ("/barber/", {}), None),
+    ("PATCH", "/barber/{barber_id}"): (lambda ctx: (f"/barber/{ctx.rng.randint(1, ctx.args.barbers)}", {"json": {"name": "Barbeiro patched"}}), None),
+    ("DELETE", "/barber/{barber_id}"): (lambda ctx: (f"/barber/{next(ctx.disposable['barbers'])}", {}), _make_disposable("barbers")),
+    ("POST", "/appointments/"): (lambda ctx: ("/appointments/", {"json": _appointment_json(ctx)}), None),
+    ("GET", "/appointments/{appointment_id}"): (lambda ctx: (f"/appointments/{ctx.rng.randint(1, max(ctx.args.barbers * ctx.args.appointments_per_barber, 1))}", {}), None),
+    ("GET", "/appointments/"): (lambda ctx: ("/appointments/", {"params": {"id_barber": ctx.rng.randint(1, ctx.args.barbers), "limit": 100}}), None),
+    ("DELETE", "/appointments/{appointment_id}"): (lambda ctx: (f"/appointments/{next(ctx.disposable['appointments'])}", {}), _make_disposable("appointments")),
+    ("GET", "/reports/subscriptions/payment-methods"): (lambda ctx: ("/reports/subscriptions/payment-methods", {}), None),
+    ("GET", "/reports/subscriptions/monthly"): (lambda ctx: ("/reports/subscriptions/monthly", {}), None),
+    ("GET", "/reports/subscriptions/active"): (lambda ctx: ("/reports/subscriptions/active", {"params": {"date_from": _day(-365), "date_to": _day(0)}}), None),
+    ("GET", "/availability"): (lambda ctx: ("/availability", {"params": {"date_from": _day(0)}}), None),
+    ("POST", "/clients/batch"): (lambda ctx: ("/clients/batch", {"json": _batch_ids(ctx)}), None),
+    ("POST", "/clients/batch/profiles"): (lambda ctx: ("/clients/batch/profiles", {"json": _batch_ids(ctx)}), None),
+    ("POST", "/subscriptions/by-clients"): (lambda ctx: ("/subscriptions/by-clients", {"json": _batch_ids(ctx)}), None),
+    ("POST", "/adress/by-clients"): (lambda ctx: ("/adress/by-clients", {"json": _batch_ids(ctx)}), None),
+    ("GET", "/export/{resource}"): (lambda ctx: (f"/export/{ctx.rng.choice(['clients', 'adress', 'subscriptions'])}", {}), None),
+    ("GET", "/stats/principal-cache"): (lambda ctx: ("/stats/principal-cache", {}), None),
+    ("GET", "/stats/client-cache"): (lambda ctx: ("/stats/client-cache", {}), None),
+    ("GET", "/stats/password-hashing"): (lambda ctx: ("/stats/password-hashing", {}), None),
+    ("GET", "/stats/pool"): (lambda ctx: ("/stats/pool", {}), None),
+    ("GET", "/stats/replica"): (lambda ctx: ("/stats/replica", {}), None),
+    ("GET", "/stats/sql-profile"): (lambda ctx: ("/stats/sql-profile", {}), None),
+    ("DELETE", "/stats/sql-profile"): (lambda ctx: ("/stats/sql-profile", {}), _snapshot_sql_profile),
+    ("POST", "/stats/sql-profile/dump"): (lambda ctx: ("/stats/sql-profile/dump", {}), None),
+    ("GET", "/metrics"): (lambda ctx: ("/metrics", {}), None),
+}
+
+# bcrypt-bound, whole-table or 100-row-batch routes get a tenth of the request budget
+HEAVY_ROUTES = {"/login", "/register", "/export/{resource}", "/clients/import", "/clients/import/csv"}
+
+# Statements per request for single-row writes: the INSERT/UPDATE/DELETE ... RETURNING plus
+# the table_versions bump. Deleting a client also deletes its addresses, subscriptions and
+# appointments; deleting a barber first checks for upcoming appointments, then deletes their
+# past ones. Subscription writes also upsert the
+# two reporting summary tables, and an update first reads the buckets it moves out of.
+WRITE_STATEMENT_BUDGET = 2
+WRITE_STATEMENT_BUDGET_OVERRIDES = {
+    "DELETE /client/{client_id}": 5,
+    "DELETE /barber/{barber_id}": 4,
+    "POST /subscriptions": 4,
+    "PATCH /subscription/{subscription_id}": 5,
+    "DELETE /subscriptions/{subscription_id}": 4,
+}
+WRITE_STATEMENT_EXEMPT = {"POST /login", "POST /register", "POST /clients/import", "POST /clients/import/csv"}
+# Batch-by-ids lookups are POST only to carry the id list in the body; they write nothing
+READ_POSTS = {"POST /clients/batch", "POST /clients/batch/profiles", "POST /subscriptions/by-clients", "POST /adress/by-clients"}
+
+# The principal cache is cleared before each route, so one user lookup per concurrent worker is tolerated
+def check_statements(results: dict, concurrency: int):
+    failures = []
+    for name, row in results.items():
+        if name.split()[0] == "GET" or name in WRITE_STATEMENT_EXEMPT or name in READ_POSTS:
+            continue
+        budget = WRITE_STATEMENT_BUDGET_OVERRIDES.get(name, WRITE_STATEMENT_BUDGET)
+        if row["sql_per_request"] > budget + concurrency / max(row["requests"], 1) + 1e-9:
+            failures.append(f"{name}: {row['sql_per_request']:.2f} statements per request, budget {budget}")
+    return failures
+
+def app_routes(app):
+    from fastapi.routing import APIRoute
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            for method in sorted(route.methods):
+                yield method, route.path
+
+#------
+#RUNNER
+#------
+
+class StatementCounter:
+    def __init__(self, *engines):
+        from sqlalchemy import event
+        self.count = 0
+        for engine in engines:
+            if engine is not None:
+                event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+async def run_route(client, ctx, method: str, url_builder, requests: int, concurrency: int, counter: StatementCounter):
+    from metrics import LatencyWindow
+    latencies = LatencyWindow(maxlen=requests)
+    statuses = {}
+    remaining = iter(range(requests))
+    headers = {"Authorization": f"Bearer {ctx.token}"}
+
+    async def worker():
+        for _ in remaining:
+            url, kwargs = url_builder(ctx)
+            started = time.perf_counter()
+            response = await client.request(method, url, headers=headers, **kwargs)
+            latencies.observe(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    statements_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    summary = latencies.summary()
+    errors = sum(n for code, n in statuses.items() if code >= 500)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+        "rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": summary["p50"] * 1000,
+        "p95_ms": summary["p95"] * 1000,
+        "p99_ms": summary["p99"] * 1000,
+        "max_ms": summary["max"] * 1000,
+        "sql_per_request": (counter.count - statements_before) / requests,
+    }
+
+async def run(args):
+    import httpx
+    import main, database
+    from http.cookiejar import CookieJar, DefaultCookiePolicy
+    from database import get_engine, get_request_engine
+    from cache import principal_cache
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    # Cookies are refused so the read-your-writes pin set by one write does not send every
+    # later read of the run to the primary, as if all requests came from a single user
+    cookies = CookieJar(DefaultCookiePolicy(allowed_domains=[]))
+    # ASGITransport does not send lifespan events, so the app's startup/shutdown is entered here
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(transport=transport, base_url="http://benchmark", cookies=cookies) as client:
+        replica = database.async_replica_engine.sync_engine if database.async_replica_engine is not None else database.replica_engine
+        counter = StatementCounter(get_request_engine(), replica)
+        login = await client.post("/login", data={"username": "bench0", "password": PASSWORD})
+        login.raise_for_status()
+        ctx = Context(args, login.json()["access_token"])
+        routes = list(app_routes(main.app))
+        missing = [f"{m} {p}" for m, p in routes if (m, p) not in SCENARIOS]
+        if missing:
+            print("no scenario for: " + ", ".join(missing))
+        for method, path in routes:
+            name = f"{method} {path}"
+            if (method, path) not in SCENARIOS or (args.routes and name not in args.routes):
+                continue
+            url_builder, setup = SCENARIOS[(method, path)]
+            requests = args.requests
+            if path in HEAVY_ROUTES:
+                requests = min(requests, max(args.concurrency, requests // 10))
+            if setup is not None:
+                setup(ctx, get_engine(), requests)
+            principal_cache.clear()
+            results[name] = await run_route(client, ctx, method, url_builder, requests, args.concurrency, counter)
+            row = results[name]
+            print(f"{name:<48} {row['rps']:>9.1f} rps  p50 {row['p50_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  p99 {row['p99_ms']:>8.2f} ms  sql/req {row['sql_per_request']:>5.2f}  5xx {row['errors']}")
+        if args.sql_profile and ctx.sql_profile is None:
+            from profiler import sql_profile
+            ctx.sql_profile = sql_profile.report()
+    return results, ctx.sql_profile
+
+#------
+#IMPORT TIME
+#------
+
+_IMPORT_PROBE = """
+import json, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+import database
+print(json.dumps({"ms": elapsed * 1000, "engine_created": database.engine is not None}))
+"""
+
+# Times `import main` in fresh interpreters (the cost every worker pays on a restart) and
+# checks that importing the app creates no engine; the fastest run is reported
+def import_time_benchmark(runs: int, budget_ms: float):
+    samples = []
+    engine_created = False
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", _IMPORT_PROBE], text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        probe = json.loads(output.strip().splitlines()[-1])
+        samples.append(probe["ms"])
+        engine_created = engine_created or probe["engine_created"]
+    result = {"runs": runs, "min_ms": round(min(samples), 1), "max_ms": round(max(samples), 1), "budget_ms": budget_ms, "engine_created": engine_created}
+    print(f"import main  min {result['min_ms']:>8.1f} ms  max {result['max_ms']:>8.1f} ms  budget {budget_ms:.0f} ms  engine at import {'yes' if engine_created else 'no'}")
+    return result
+
+def check_import_time(result: dict):
+    failures = []
+    if result["min_ms"] > result["budget_ms"]:
+        failures.append(f"import main: {result['min_ms']:.1f} ms, budget {result['budget_ms']:.0f} ms")
+    if result["engine_created"]:
+        failures.append("import main: a database engine was created at import time")
+    return failures
+
+#------
+#SERIALIZATION
+#------
+
+# Encodes one large list response of detached ORM rows both ways, no database involved:
+# "default" is the old handler path (model_validate per row, then FastAPI's response_model
+# validation, jsonable_encoder and JSONResponse), "fast" is serialization.list_response.
+def serialization_benchmark(rows: int, repeat: int = 5):
+    import models, schemas
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from serialization import list_response
+
+    today = date.today()
+    cases = {
+        "adress": (schemas.AdressRead, [models.Adress(id_adress=i, logradouro="Rua Bench", number=str(i), neighborhood="Centro", city="Rio de Janeiro", complement="", id_client=i) for i in range(rows)]),
+        "subscriptions": (schemas.SubscriptionRead, [models.Subscriptions(id_subscription=i, start_date=today, duration=30, payment_method="pix", end_date=today, id_client=i, auto_renew=False, status="active") for i in range(rows)]),
+        "barbers": (schemas.BarberRead, [models.Barber(id_barber=i, name=f"Barbeiro {i}") for i in range(rows)]),
+    }
+
+    async def default_path(schema, field, orm_rows):
+        content = await serialize_response(field=field, response_content=[schema.model_validate(row) for row in orm_rows])
+        return JSONResponse(content).body
+
+    async def fast_path(schema, field, orm_rows):
+        return list_response(schema, orm_rows).body
+
+    async def measure(path, schema, field, orm_rows):
+        timings = []
+        for _ in range(repeat):
+            started = time.process_time()
+            body = await path(schema, field, orm_rows)
+            timings.append(time.process_time() - started)
+        return min(timings) * 1000, body
+
+    async def run_all():
+        results = {}
+        for name, (schema, orm_rows) in cases.items():
+            field = create_model_field(name="Response", type_=list[schema], mode="serialization")
+            default_ms, default_body = await measure(default_path, schema, field, orm_rows)
+            fast_ms, fast_body = await measure(fast_path, schema, field, orm_rows)
+            assert json.loads(default_body) == json.loads(fast_body), f"{name}: fast path output differs"
+            results[name] = {"rows": rows, "default_cpu_ms": round(default_ms, 2), "fast_cpu_ms": round(fast_ms, 2), "speedup": round(default_ms / fast_ms, 1)}
+            row = results[name]
+            print(f"serialize {name:<14} {rows} rows  default {row['default_cpu_ms']:>8.2f} ms  fast {row['fast_cpu_ms']:>8.2f} ms  x{row['speedup']}")
+        return results
+
+    return asyncio.run(run_all())
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results: dict, previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)["routes"]
+    print(f"\n{'route':<48} {'p95 before':>11} {'p95 now':>9} {'rps before':>11} {'rps now':>9}")
+    for name, row in results.items():
+        if name in previous:
+            old = previous[name]
+            print(f"{name:<48} {old['p95_ms']:>11.2f} {row['p95_ms']:>9.2f} {old['rps']:>11.1f} {row['rps']:>9.1f}")
+
+def print_sql_profile(profile: dict, top: int = 10):
+    print(f"\nSQL profile: {profile['executions']} statements, {profile['distinct_statements']} distinct")
+    for entry in profile["top_by_total_time"][:top]:
+        print(f"{entry['total_ms']:>10.1f} ms {entry['count']:>7} x  {entry['statement'][:100]}")
+    for entry in profile["full_scans"][:top]:
+        print(f"full scan: {entry['statement'][:100]}")
+    for entry in profile["n_plus_one"][:top]:
+        print(f"possible N+1 in {entry['route']}: {entry['max_repeats']} x {entry['statement'][:80]}")
+
+def main():
+    args = parse_args()
+    config.SQLALCHEMY_DATABASE_URL = args.database_url
+    config.DB_ASYNC = args.async_db
+    config.DB_REPLICA_URL = args.replica_url
+    config.SQL_PROFILE = args.sql_profile
+
+    import_time = import_time_benchmark(args.import_runs, args.import_budget_ms) if args.import_runs else {}
+
+    if not args.no_seed:
+        from database import get_engine
+        started = time.perf_counter()
+        seed(get_engine(), args)
+        print(f"seeded in {time.perf_counter() - started:.1f}s")
+
+    results, profile = asyncio.run(run(args))
+    from database import replica_health
+    replica = replica_health.stats()
+    serialization = serialization_benchmark(args.serialization_rows) if args.serialization_rows else {}
+
+    revision = git_revision()
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "revision": revision,
+            "created_at": datetime.now().isoformat(),
+            "database": args.database_url.split("@")[-1],
+            "async_db": args.async_db,
+            "replica": replica,
+            "volumes": {k: getattr(args, k) for k in ("users", "clients", "adresses_per_client", "subscriptions_per_client", "barbers", "appointments_per_barber")},
+            "concurrency": args.concurrency,
+            "routes": results,
+            "serialization": serialization,
+            "import_time": import_time,
+            "sql_profile": profile,
+        }, f, indent=2)
+    print(f"results written to {path}")
+    if args.compare:
+        compare(results, args.compare)
+    if profile:
+        print_sql_profile(profile)
+
+    from hashing import hash_pool
+    hash_pool.shutdown()
+
+    failures = check_import_time(import_time) if import_time else []
+    if args.check_statements:
+        failures += check_statements(results, args.concurrency)
+    for failure in failures:
+        print("over budget: " + failure)
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+import config
+
+PRINCIPAL_CACHE_SIZE = getattr(config, "PRINCIPAL_CACHE_SIZE", 1024)
+PRINCIPAL_CACHE_TTL = getattr(config, "PRINCIPAL_CACHE_TTL", 60)
+CLIENT_CACHE_SIZE = getattr(config, "CLIENT_CACHE_SIZE", 10000)
+CLIENT_CACHE_TTL = getattr(config, "CLIENT_CACHE_TTL", 300)
+# redis://host:6379/0 shares the client cache between workers; local:// runs the same shared
+# code path against an in-process stand-in; unset keeps a per-process TTLCache
+CLIENT_CACHE_URL = getattr(config, "CLIENT_CACHE_URL", None)
+
+# Bounded LRU mapping whose entries expire after `ttl` seconds
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Bumped on every invalidation, see ClientCache.set
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "local",
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+#------
+#PRINCIPAL CACHE
+#------
+
+# Authenticated users keyed by the token's `sub`, so get_current_user does not hit Users on every request
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+def invalidate_user(login: str):
+    principal_cache.invalidate(login)
+
+#------
+#CLIENT CACHE
+#------
+
+# Redis-backed cache with the TTLCache interface, for sharing entries between workers.
+# Values are stored as JSON; hit and miss counters are per process.
+class RedisCache:
+    def __init__(self, client, ttl: float, prefix: str):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._redis = client
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value):
+        self._redis.set(self.prefix + key, json.dumps(value), ex=int(self.ttl))
+
+    def invalidate(self, key):
+        self._redis.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self._redis.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self._redis.delete(*keys)
+
+    def generation(self):
+        return int(self._redis.get(self.prefix + "generation") or 0)
+
+    def bump_generation(self):
+        self._redis.incr(self.prefix + "generation")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self._redis.info("stats").get("evicted_keys", 0),
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+# In-process stand-in for the handful of Redis commands RedisCache uses (local://)
+class LocalRedis:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (0, None))
+            self._data[key] = (int(value) + 1, expires_at)
+
+    def scan_iter(self, match: str):
+        with self._lock:
+            return [key for key in self._data if key.startswith(match.rstrip("*"))]
+
+    def info(self, section):
+        return {"evicted_keys": 0}
+
+def make_cache(url: str | None, maxsize: int, ttl: float, prefix: str):
+    if not url:
+        return TTLCache(maxsize, ttl)
+    if url.startswith("local://"):
+        return RedisCache(LocalRedis(), ttl, prefix)
+    import redis  # optional dependency, only needed when a Redis URL is configured
+    return RedisCache(redis.Redis.from_url(url), ttl, prefix)
+
+# Client rows (as dicts) by id, plus a cpf -> id index; only found clients are cached, so
+# creating a client never needs an invalidation. A cpf entry whose client now carries a
+# different cpf is treated as a miss.
+class ClientCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, client):
+        if client is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return client
+
+    def get_by_id(self, client_id: int):
+        return self._count(self.backend.get(f"id:{client_id}"))
+
+    def get_by_cpf(self, cpf: str):
+        client_id = self.backend.get(f"cpf:{cpf}")
+        client = self.backend.get(f"id:{client_id}") if client_id is not None else None
+        if client is not None and client["cpf"] != cpf:
+            client = None
+        return self._count(client)
+
+    # Read-through callers take generation() before querying and pass it here; if any
+    # invalidation happened in between, the row they read may be stale and is not stored
+    def generation(self):
+        return self.backend.generation()
+
+    def set(self, client: dict, generation: int):
+        if self.backend.generation() != generation:
+            return
+        self.backend.set(f"id:{client['id_client']}", client)
+        self.backend.set(f"cpf:{client['cpf']}", client["id_client"])
+
+    def invalidate(self, client_id: int):
+        self.backend.bump_generation()
+        self.backend.invalidate(f"id:{client_id}")
+
+    def clear(self):
+        self.backend.clear()
+
+    # Hit ratio per lookup; the backend's own counters see two reads for a cpf lookup
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+client_cache = ClientCache(make_cache(CLIENT_CACHE_URL, CLIENT_CACHE_SIZE, CLIENT_CACHE_TTL, "siscpa:client:"))
@@ -0,0 +1,69 @@
+import argparse
+import time
+from datetime import datetime
+from sqlalchemy import delete, exists, or_, select
+import config, models
+from crud import archive_rows, bump_versions, delete_subscriptions
+from database import SessionLocal, init_engine
+
+# Purges addresses and subscriptions whose client no longer exists (left behind by the old
+# delete_client, which only removed the Clients row). Meant to run from cron:
+#
+#   python compaction.py --archive
+#
+# The table is walked in primary-key windows of COMPACTION_CHUNK_SIZE rows; each window's
+# orphans are removed in their own short transaction, with a pause in between so the job
+# never holds locks for long or starves the API of connections.
+
+COMPACTION_CHUNK_SIZE = getattr(config, "COMPACTION_CHUNK_SIZE", 1000)
+COMPACTION_PAUSE = getattr(config, "COMPACTION_PAUSE", 0.05)
+
+ORPHAN_TABLES = {
+    "Adress": (models.Adress, models.Adress.id_adress),
+    "Subscriptions": (models.Subscriptions, models.Subscriptions.id_subscription),
+}
+
+def _is_orphan(model):
+    return or_(model.id_client.is_(None), ~exists().where(models.Clients.id_client == model.id_client))
+
+def purge_orphans(table: str, archive: bool = False, chunk_size: int = COMPACTION_CHUNK_SIZE, pause: float = COMPACTION_PAUSE):
+    model, pk = ORPHAN_TABLES[table]
+    purged = 0
+    last_id = 0
+    init_engine()
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.execute(select(pk, _is_orphan(model)).where(pk > last_id).order_by(pk).limit(chunk_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            ids = [row_id for row_id, orphan in rows if orphan]
+            if ids:
+                # Re-checked in the write itself, in case a row was re-pointed since the scan
+                where = pk.in_(ids) & _is_orphan(model)
+                if archive:
+                    archive_rows(db, model, where, datetime.utcnow())
+                if model is models.Subscriptions:
+                    purged += delete_subscriptions(db, where)
+                else:
+                    purged += db.execute(delete(model).where(where)).rowcount
+                bump_versions(db, table)
+            db.commit()
+            if pause:
+                time.sleep(pause)
+    finally:
+        db.close()
+    return purged
+
+def compact(archive: bool = False, chunk_size: int = COMPACTION_CHUNK_SIZE, pause: float = COMPACTION_PAUSE):
+    return {table: purge_orphans(table, archive, chunk_size, pause) for table in ORPHAN_TABLES}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove addresses and subscriptions that belong to no client")
+    parser.add_argument("--archive", action="store_true", help="copy orphans to the archive tables before deleting them")
+    parser.add_argument("--chunk-size", type=int, default=COMPACTION_CHUNK_SIZE)
+    parser.add_argument("--pause", type=float, default=COMPACTION_PAUSE, help="seconds to sleep between chunks")
+    args = parser.parse_args()
+    for table, purged in compact(args.archive, args.chunk_size, args.pause).items():
+        print(f"{table}: {purged} orphan rows {'archived' if args.archive else 'deleted'}")
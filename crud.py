@@ -1,56 +1,307 @@
-from sqlalchemy.orm import Session
-import models, schemas
+from sqlalchemy import DateTime, and_, delete, exists, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from collections import defaultdict
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import date, datetime, timedelta
+import models, schemas, config
 from auth import get_password_hash
+from cache import invalidate_user, client_cache
+from search import index_client, unindex_client, client_index
+from availability import check_interval, local_datetime, overlapping
+import reporting
 from fastapi import HTTPException
 
+IMPORT_CHUNK_SIZE = getattr(config, "IMPORT_CHUNK_SIZE", 5000)
+
+# Keyset pagination on the primary key: "WHERE pk > after ORDER BY pk LIMIT n" stays
+# an index range scan no matter how deep the page is, unlike OFFSET
+def _keyset(query, pk, limit: int | None, after: int | None):
+    if after is not None:
+        query = query.filter(pk > after)
+    query = query.order_by(pk)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+# Bumped right before the write commits, so a reader can never see the new version with old rows
+def bump_versions(db: Session, *tables: str):
+    db.execute(
+        update(models.TableVersions)
+        .where(models.TableVersions.name.in_(tables))
+        .values(version=models.TableVersions.version + 1)
+    )
+
+def get_table_versions(db: Session, tables: tuple):
+    rows = dict(db.execute(select(models.TableVersions.name, models.TableVersions.version).where(models.TableVersions.name.in_(tables))).all())
+    return [rows.get(table, 0) for table in tables]
+
+# Single-statement writes: INSERT/UPDATE/DELETE ... RETURNING hands back the row, so there
+# is no SELECT before the change and no refresh after the commit. Dialects without
+# RETURNING (MySQL) go through the ORM unit of work instead.
+def _returning(db: Session, kind: str):
+    return getattr(db.get_bind().dialect, f"{kind}_returning", False)
+
+# `requires` is an EXISTS clause checked in the same statement (INSERT ... SELECT ... WHERE);
+# returns None when it does not hold
+def _insert_row(db: Session, model, values: dict, requires=None):
+    if not _returning(db, "insert"):
+        if requires is not None and not db.scalar(select(requires)):
+            return None
+        row = model(**values)
+        db.add(row)
+        db.flush()
+        return row
+    stmt = insert(model)
+    if requires is None:
+        stmt = stmt.values(**values)
+    else:
+        table = model.__table__
+        source = select(*[literal(value, table.c[key].type) for key, value in values.items()]).where(requires)
+        stmt = stmt.from_select(list(values), source)
+    return db.scalars(stmt.returning(model)).first()
+
+def _update_row(db: Session, model, pk, ident, values: dict):
+    if not values:
+        return db.get(model, ident)
+    if not _returning(db, "update"):
+        row = db.get(model, ident)
+        if row is not None:
+            for key, value in values.items():
+                setattr(row, key, value)
+            db.flush()
+        return row
+    stmt = update(model).where(pk == ident).values(**values).returning(model)
+    return db.scalars(stmt, execution_options={"populate_existing": True}).first()
+
+def _delete_row(db: Session, model, pk, ident):
+    if not _returning(db, "delete"):
+        row = db.get(model, ident)
+        if row is not None:
+            db.delete(row)
+            db.flush()
+        return row
+    return db.scalars(delete(model).where(pk == ident).returning(model)).first()
+
+# INSERT ... SELECT of the matching rows into the model's archive table, in the caller's transaction
+def archive_rows(db: Session, model, where, archived_at: datetime):
+    archive = models.ARCHIVES[model].__table__
+    columns = [column.name for column in archive.c if column.name not in ("id_archive", "archived_at")]
+    source = select(*[model.__table__.c[name] for name in columns], literal(archived_at, DateTime)).where(where)
+    db.execute(insert(archive).from_select(columns + ["archived_at"], source))
+
 def get_user(db: Session, login: str):
     return db.query(models.Users).filter(models.Users.login == login).first()
 
-def create_user(db: Session, user: schemas.UsersCreate):
-    hashed_password = get_password_hash(user.password)
-    db_user = models.Users(login=user.login, hashed_password=hashed_password, position=user.position)
-    db.add(db_user)
+def create_user(db: Session, user: schemas.UsersCreate, hashed_password: str | None = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
+    db_user = _insert_row(db, models.Users, {"login": user.login, "hashed_password": hashed_password, "position": user.position})
     db.commit()
-    db.refresh(db_user)
+    invalidate_user(db_user.login)
     return db_user
 
 #------
 #CLIENT CRUD
 #------
 
+# INSERT that can carry ON CONFLICT on the dialects that support it
+def _upsert_insert(db: Session, model):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return None
+
+# Returns None when the CPF is already registered; a single INSERT ... ON CONFLICT DO NOTHING round trip
 def create_client(db: Session, client: schemas.ClientCreate):
-    db_client = models.Clients(cpf=client.cpf, name=client.name, phone=client.phone)
-    db.add(db_client)
+    stmt = _upsert_insert(db, models.Clients)
+    if stmt is None or not _returning(db, "insert"):
+        db_client = models.Clients(cpf=client.cpf, name=client.name, phone=client.phone)
+        db.add(db_client)
+        bump_versions(db, "Clients")
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return None
+        index_client(db_client)
+        return db_client
+    stmt = stmt.values(**client.model_dump()).on_conflict_do_nothing(index_elements=[models.Clients.cpf])
+    db_client = db.scalars(stmt.returning(models.Clients)).first()
+    if db_client is not None:
+        bump_versions(db, "Clients")
+    db.commit()
+    if db_client is not None:
+        index_client(db_client)
+    return db_client
+
+def upsert_client(db: Session, client: schemas.ClientCreate):
+    stmt = _upsert_insert(db, models.Clients)
+    if stmt is None or not _returning(db, "insert"):
+        db_client = get_client(db, client.cpf)
+        if db_client is None:
+            return create_client(db, client)
+        return update_client(db, db_client.id_client, schemas.ClientUpdate(**client.model_dump()))
+    stmt = stmt.values(**client.model_dump())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Clients.cpf],
+        set_={"name": stmt.excluded.name, "phone": stmt.excluded.phone, "name_search": stmt.excluded.name_search},
+    )
+    db_client = db.scalars(stmt.returning(models.Clients), execution_options={"populate_existing": True}).one()
+    bump_versions(db, "Clients")
     db.commit()
-    db.refresh(db_client)
+    client_cache.invalidate(db_client.id_client)
+    index_client(db_client)
     return db_client
 
+# Each chunk costs one CPF IN query, one multi-row INSERT ... RETURNING and one commit
+# (plus a second CPF IN query on dialects without RETURNING)
+def import_clients(db: Session, clients: list, chunk_size: int = IMPORT_CHUNK_SIZE):
+    report = []
+    seen = set()
+    for start in range(0, len(clients), chunk_size):
+        chunk = clients[start:start + chunk_size]
+        cpfs = {client.cpf for _, client in chunk}
+        existing = {cpf for (cpf,) in db.query(models.Clients.cpf).filter(models.Clients.cpf.in_(cpfs))}
+        to_insert = []
+        for row, client in chunk:
+            if client.cpf in existing or client.cpf in seen:
+                report.append({"row": row, "cpf": client.cpf, "status": "duplicate", "detail": "Client already registered"})
+                continue
+            seen.add(client.cpf)
+            to_insert.append((row, client))
+        if not to_insert:
+            continue
+        rows = [client.model_dump() for _, client in to_insert]
+        stmt = _upsert_insert(db, models.Clients)
+        if stmt is None or not _returning(db, "insert"):
+            # No RETURNING (MySQL): executemany INSERT IGNORE, then read the ids back by CPF.
+            # A CPF registered concurrently is reported with that row's id.
+            db.execute(insert(models.Clients).prefix_with("IGNORE", dialect="mysql"), rows)
+            created = dict(db.query(models.Clients.cpf, models.Clients.id_client).filter(models.Clients.cpf.in_([row["cpf"] for row in rows])).all())
+        else:
+            # A concurrent registration may land between the IN query and the insert
+            stmt = stmt.on_conflict_do_nothing(index_elements=[models.Clients.cpf])
+            created = dict(db.execute(stmt.returning(models.Clients.cpf, models.Clients.id_client), rows).all())
+        if created:
+            bump_versions(db, "Clients")
+        db.commit()
+        for row, client in to_insert:
+            if client.cpf in created:
+                client_index.add(created[client.cpf], models.search_key(client.name))
+                report.append({"row": row, "cpf": client.cpf, "status": "created", "id_client": created[client.cpf]})
+            else:
+                report.append({"row": row, "cpf": client.cpf, "status": "duplicate", "detail": "Client already registered"})
+    return report
+
+# Read-through client_cache: hit or miss, callers get a schemas.ClientRead snapshot, never the ORM row
+def _cached_client(db_client, generation: int):
+    if db_client is None:
+        return None
+    client = schemas.ClientRead.model_validate(db_client)
+    client_cache.set(client.model_dump(), generation)
+    return client
+
 def get_client(db:Session, cpf: str):
-    return db.query(models.Clients).filter(models.Clients.cpf == cpf).first()
+    cpf = schemas.normalize_cpf(cpf)
+    cached = client_cache.get_by_cpf(cpf)
+    if cached is not None:
+        return schemas.ClientRead.model_validate(cached)
+    generation = client_cache.generation()
+    return _cached_client(db.query(models.Clients).filter(models.Clients.cpf == cpf).first(), generation)
 
 def get_client_by_name(db:Session, name: str):
     return db.query(models.Clients).filter(models.Clients.name == name).first()
 
 def get_client_by_id(db: Session, client_id: int):
-    return db.query(models.Clients).filter(models.Clients.id_client == client_id).first()
+    cached = client_cache.get_by_id(client_id)
+    if cached is not None:
+        return schemas.ClientRead.model_validate(cached)
+    generation = client_cache.generation()
+    return _cached_client(db.query(models.Clients).filter(models.Clients.id_client == client_id).first(), generation)
+
+# Client plus addresses and subscriptions in three queries, independent of how many related rows exist
+def get_client_profile(db: Session, cpf: str):
+    cpf = schemas.normalize_cpf(cpf)
+    return (
+        db.query(models.Clients)
+        .options(selectinload(models.Clients.adresses), selectinload(models.Clients.subscriptions))
+        .filter(models.Clients.cpf == cpf)
+        .first()
+    )
 
+# Batch lookups for the /batch and /by-clients endpoints: one IN query whatever the number of ids
+def get_clients_by_ids(db: Session, client_ids: list):
+    return {c.id_client: c for c in db.query(models.Clients).filter(models.Clients.id_client.in_(client_ids))}
 
-def update_client(db: Session, db_client: models.Clients, client_update: schemas.ClientUpdate):
-    for key, value in client_update.dict(exclude_unset=True).items():
-        setattr(db_client, key, value)
-    
-    db.commit()
-    db.refresh(db_client)
+def _group_by_client(rows):
+    groups = defaultdict(list)
+    for row in rows:
+        groups[row.id_client].append(row)
+    return dict(groups)
+
+# Fills a client's relationships from batch-loaded rows, so serializing it triggers no lazy load
+def attach_profile(db_client: models.Clients, adresses: list, subscriptions: list):
+    set_committed_value(db_client, "adresses", adresses)
+    set_committed_value(db_client, "subscriptions", subscriptions)
     return db_client
 
-def delete_client(db: Session, client_id: int):
-    db_client = db.query(models.Clients).filter(models.Clients.id_client == client_id).first()
+def get_all_clients(db: Session, limit: int | None = None, after: int | None = None):
+    query = db.query(models.Clients)
+    return _keyset(query, models.Clients.id_client, limit, after).all()
+
+
+# Partial update: only the fields the caller sent; returns None when the client does not exist
+def update_client(db: Session, client_id: int, client_update: schemas.ClientUpdate):
+    values = client_update.model_dump(exclude_unset=True)
+    if "name" in values:
+        values["name_search"] = models.search_key(values["name"])
+    try:
+        db_client = _update_row(db, models.Clients, models.Clients.id_client, client_id, values)
+        if db_client is None:
+            db.rollback()
+            return None
+        bump_versions(db, "Clients")
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Client already registered")
+    client_cache.invalidate(client_id)
+    index_client(db_client)
+    return db_client
+
+# Removes the client with their addresses, subscriptions and appointments in one
+# transaction, one set-based statement per table; with archive=True the rows are copied
+# to the archive tables first
+def delete_client(db: Session, client_id: int, archive: bool = False):
+    children = (
+        (models.Adress, models.Adress.id_client == client_id),
+        (models.Subscriptions, models.Subscriptions.id_client == client_id),
+        (models.Appointments, models.Appointments.id_client == client_id),
+    )
+    if archive:
+        archived_at = datetime.utcnow()
+        for model, where in children:
+            archive_rows(db, model, where, archived_at)
+        archive_rows(db, models.Clients, models.Clients.id_client == client_id, archived_at)
+    for model, where in children:
+        if model is models.Subscriptions:
+            delete_subscriptions(db, where)
+        else:
+            db.execute(delete(model).where(where))
+    db_client = _delete_row(db, models.Clients, models.Clients.id_client, client_id)
 
     if not db_client:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Client not found")
 
-    db.delete(db_client)
+    bump_versions(db, "Clients", "Adress", "Subscriptions", "Appointments")
     db.commit()
+    client_cache.invalidate(client_id)
+    unindex_client(client_id)
 
     return db_client
 
@@ -58,17 +309,31 @@ def delete_client(db: Session, client_id: int):
 #SUBSCRIPTION CRUD
 #------
 
+# Set-based subscription delete that also takes the rows out of the reporting summaries;
+# RETURNING hands back the removed rows' buckets in the same statement
+def delete_subscriptions(db: Session, where):
+    table = models.Subscriptions.__table__
+    columns = (table.c.start_date, table.c.end_date, table.c.payment_method)
+    if _returning(db, "delete"):
+        removed = db.execute(delete(table).where(where).returning(*columns)).all()
+    else:
+        removed = db.execute(select(*columns).where(where)).all()
+        db.execute(delete(table).where(where))
+    reporting.record(db, removed=removed)
+    return len(removed)
+
+def _client_exists(client_id: int):
+    return exists().where(models.Clients.id_client == client_id)
+
+# Returns None when the client does not exist; the check is part of the INSERT itself
 def create_subscription(db: Session, subscription: schemas.SubscriptionCreate):
-    db_subscription = models.Subscriptions(
-        start_date=subscription.start_date,
-        duration=subscription.duration,
-        payment_method=subscription.payment_method,
-        end_date=subscription.end_date,
-        id_client=subscription.id_client
-    )
-    db.add(db_subscription)
+    db_subscription = _insert_row(db, models.Subscriptions, subscription.model_dump(), requires=_client_exists(subscription.id_client))
+    if db_subscription is None:
+        db.rollback()
+        return None
+    reporting.record(db, added=[db_subscription])
+    bump_versions(db, "Subscriptions")
     db.commit()
-    db.refresh(db_subscription)
     return db_subscription
 
 def get_subscription_by_id(db: Session, subscription_id: int):
@@ -77,21 +342,79 @@ def get_subscription_by_id(db: Session, subscription_id: int):
 def get_subscriptions_by_client(db: Session, client_id: int):
     return db.query(models.Subscriptions).filter(models.Subscriptions.id_client == client_id).all()
 
-def update_subscription(db: Session, db_subscription: models.Subscriptions, subscription_update: schemas.SubscriptionCreate):
-    for key, value in subscription_update.dict(exclude_unset=True).items():
-        setattr(db_subscription, key, value)
-    
+def get_subscriptions_by_clients(db: Session, client_ids: list):
+    query = db.query(models.Subscriptions).filter(models.Subscriptions.id_client.in_(client_ids))
+    return _group_by_client(query.order_by(models.Subscriptions.id_client, models.Subscriptions.id_subscription))
+
+def get_all_subscriptions(db: Session, limit: int | None = None, after: int | None = None, id_client: int | None = None, payment_method: str | None = None):
+    query = db.query(models.Subscriptions)
+    if id_client is not None:
+        query = query.filter(models.Subscriptions.id_client == id_client)
+    if payment_method is not None:
+        query = query.filter(models.Subscriptions.payment_method == payment_method)
+    return _keyset(query, models.Subscriptions.id_subscription, limit, after).all()
+
+def get_active_subscriptions(db: Session, as_of: date, limit: int | None = None, after: int | None = None):
+    query = db.query(models.Subscriptions).filter(
+        models.Subscriptions.end_date >= as_of,
+        models.Subscriptions.start_date <= as_of,
+    )
+    return _keyset(query, models.Subscriptions.id_subscription, limit, after).all()
+
+def get_expiring_subscriptions(db: Session, as_of: date, days: int, limit: int | None = None, after: int | None = None):
+    query = db.query(models.Subscriptions).filter(
+        models.Subscriptions.end_date.between(as_of, as_of + timedelta(days=days)),
+        models.Subscriptions.start_date <= as_of,
+    )
+    return _keyset(query, models.Subscriptions.id_subscription, limit, after).all()
+
+def get_expired_subscriptions(db: Session, as_of: date, since: date, limit: int | None = None, after: int | None = None):
+    query = db.query(models.Subscriptions).filter(
+        models.Subscriptions.end_date >= since,
+        models.Subscriptions.end_date < as_of,
+    )
+    return _keyset(query, models.Subscriptions.id_subscription, limit, after).all()
+
+# Served by (id_client, end_date): the latest-ending subscription that covers as_of
+def get_current_subscription(db: Session, client_id: int, as_of: date):
+    return (
+        db.query(models.Subscriptions)
+        .filter(
+            models.Subscriptions.id_client == client_id,
+            models.Subscriptions.end_date >= as_of,
+            models.Subscriptions.start_date <= as_of,
+        )
+        .order_by(models.Subscriptions.end_date.desc())
+        .first()
+    )
+
+def update_subscription(db: Session, subscription_id: int, subscription_update: schemas.SubscriptionCreate):
+    values = subscription_update.model_dump(exclude_unset=True)
+    table = models.Subscriptions.__table__
+    # The old buckets, locked until commit so a concurrent update cannot move them in between
+    old = db.execute(
+        select(table.c.start_date, table.c.end_date, table.c.payment_method)
+        .where(table.c.id_subscription == subscription_id)
+        .with_for_update()
+    ).first()
+    if old is None:
+        db.rollback()
+        return None
+    db_subscription = _update_row(db, models.Subscriptions, models.Subscriptions.id_subscription, subscription_id, values)
+    reporting.record(db, added=[db_subscription], removed=[old])
+    bump_versions(db, "Subscriptions")
     db.commit()
-    db.refresh(db_subscription)
     return db_subscription
 
 def delete_subscription(db: Session, subscription_id: int):
-    db_subscription = db.query(models.Subscriptions).filter(models.Subscriptions.id_subscription == subscription_id).first()
+    db_subscription = _delete_row(db, models.Subscriptions, models.Subscriptions.id_subscription, subscription_id)
 
     if not db_subscription:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Subscription not found")
 
-    db.delete(db_subscription)
+    reporting.record(db, removed=[db_subscription])
+    bump_versions(db, "Subscriptions")
     db.commit()
 
     return db_subscription
@@ -101,10 +424,12 @@ def delete_subscription(db: Session, subscription_id: int):
 #------
 
 def create_adress(db: Session, adress: schemas.AdressCreate):
-    db_adress = models.Adress(**adress.model_dump())
-    db.add(db_adress)
+    db_adress = _insert_row(db, models.Adress, adress.model_dump(), requires=_client_exists(adress.id_client))
+    if db_adress is None:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Client not found. Cannot create adress.")
+    bump_versions(db, "Adress")
     db.commit()
-    db.refresh(db_adress)
     return db_adress
 
 def get_adress(db: Session, adress_id: int):
@@ -113,63 +438,148 @@ def get_adress(db: Session, adress_id: int):
 def get_adresses_by_client(db: Session, client_id: int):
     return db.query(models.Adress).filter(models.Adress.id_client == client_id).all()
 
-def get_all_adresses(db: Session):
-    return db.query(models.Adress).all()
+def get_adresses_by_clients(db: Session, client_ids: list):
+    query = db.query(models.Adress).filter(models.Adress.id_client.in_(client_ids))
+    return _group_by_client(query.order_by(models.Adress.id_client, models.Adress.id_adress))
+
+def get_all_adresses(db: Session, limit: int | None = None, after: int | None = None, city: str | None = None, neighborhood: str | None = None, id_client: int | None = None):
+    query = db.query(models.Adress)
+    if city is not None:
+        query = query.filter(models.Adress.city == city)
+    if neighborhood is not None:
+        query = query.filter(models.Adress.neighborhood == neighborhood)
+    if id_client is not None:
+        query = query.filter(models.Adress.id_client == id_client)
+    return _keyset(query, models.Adress.id_adress, limit, after).all()
 
 def update_adress(db: Session, adress_id: int, adress_update: schemas.AdressCreate):
-    db_adress = db.query(models.Adress).filter(models.Adress.id_adress == adress_id).first()
+    db_adress = _update_row(db, models.Adress, models.Adress.id_adress, adress_id, adress_update.model_dump())
     if not db_adress:
+        db.rollback()
         return None
-    
-    for key, value in adress_update.model_dump().items():
-        setattr(db_adress, key, value)
-    
+    bump_versions(db, "Adress")
     db.commit()
-    db.refresh(db_adress)
     return db_adress
 
 
 def delete_adress(db: Session, adress_id: int):
-    db_adress = db.query(models.Adress).filter(models.Adress.id_adress == adress_id).first()
-    if db_adress:
-        db.delete(db_adress)
-        db.commit()
-        return True
-    return False
+    if _delete_row(db, models.Adress, models.Adress.id_adress, adress_id) is None:
+        db.rollback()
+        return False
+    bump_versions(db, "Adress")
+    db.commit()
+    return True
 
 #------
 #BARBER CRUD
 #------
 
 def create_barber(db: Session, barber: schemas.BarberCreate):
-    db_barber = models.Barber(**barber.model_dump())
-    db.add(db_barber)
+    db_barber = _insert_row(db, models.Barber, barber.model_dump())
+    bump_versions(db, "Barber")
     db.commit()
-    db.refresh(db_barber)
     return db_barber
 
 def get_barber(db: Session, barber_id: int):
     return db.query(models.Barber).filter(models.Barber.id_barber == barber_id).first()
 
-def get_all_barbers(db: Session):
-    return db.query(models.Barber).all()
+def get_all_barbers(db: Session, limit: int | None = None, after: int | None = None):
+    query = db.query(models.Barber)
+    return _keyset(query, models.Barber.id_barber, limit, after).all()
 
 def update_barber(db: Session, barber_id: int, barber_update: schemas.BarberCreate):
-    db_barber = db.query(models.Barber).filter(models.Barber.id_barber == barber_id).first()
+    db_barber = _update_row(db, models.Barber, models.Barber.id_barber, barber_id, barber_update.model_dump())
     if not db_barber:
+        db.rollback()
         return None
-    
-    for key, value in barber_update.model_dump().items():
-        setattr(db_barber, key, value)
-    
+    bump_versions(db, "Barber")
     db.commit()
-    db.refresh(db_barber)
     return db_barber
 
+# A barber with appointments still ahead cannot be removed; past ones go with them. Only
+# past rows are deleted, so a booking that slips in after the check makes the barber delete
+# fail on the foreign key (Postgres) instead of being dropped silently.
 def delete_barber(db: Session, barber_id: int):
-    db_barber = db.query(models.Barber).filter(models.Barber.id_barber == barber_id).first()
-    if db_barber:
-        db.delete(db_barber)
+    appointments = models.Appointments
+    now = datetime.now()
+    upcoming = db.scalar(select(exists().where(appointments.id_barber == barber_id, appointments.end_at > now)))
+    if upcoming:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Barber has upcoming appointments")
+    try:
+        db.execute(delete(appointments).where(appointments.id_barber == barber_id, appointments.end_at <= now))
+        if _delete_row(db, models.Barber, models.Barber.id_barber, barber_id) is None:
+            db.rollback()
+            return False
+        bump_versions(db, "Barber", "Appointments")
         db.commit()
-        return True
-    return False
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Barber has upcoming appointments")
+    return True
+
+#------
+#APPOINTMENT CRUD
+#------
+
+def _slot_is_free(barber_id: int, start_at: datetime, end_at: datetime):
+    return ~exists().where(models.Appointments.id_barber == barber_id, *overlapping(start_at, end_at))
+
+# Booking is one INSERT ... SELECT ... WHERE <barber and client exist> AND NOT EXISTS
+# <overlapping appointment>. SQLite holds the write lock for the whole statement, so two
+# racing bookings cannot both pass the check; on Postgres the exclusion constraint turns
+# the loser of a race into an IntegrityError. Dialects without RETURNING lock the barber
+# row first, which serializes bookings per barber.
+def create_appointment(db: Session, appointment: schemas.AppointmentCreate):
+    error = check_interval(appointment.start_at, appointment.end_at)
+    if error is not None:
+        raise HTTPException(status_code=422, detail=error)
+    if not _returning(db, "insert"):
+        db.execute(select(models.Barber.id_barber).where(models.Barber.id_barber == appointment.id_barber).with_for_update())
+    requires = and_(
+        exists().where(models.Barber.id_barber == appointment.id_barber),
+        _client_exists(appointment.id_client),
+        _slot_is_free(appointment.id_barber, appointment.start_at, appointment.end_at),
+    )
+    try:
+        db_appointment = _insert_row(db, models.Appointments, appointment.model_dump(), requires=requires)
+    except IntegrityError:
+        db.rollback()
+        db_appointment = None
+    if db_appointment is None:
+        db.rollback()
+        # Only a failed booking pays for finding out why, in one more statement
+        barber_exists, client_exists = db.execute(select(
+            exists().where(models.Barber.id_barber == appointment.id_barber), _client_exists(appointment.id_client)
+        )).one()
+        if not barber_exists:
+            raise HTTPException(status_code=404, detail="Barbeiro não encontrado")
+        if not client_exists:
+            raise HTTPException(status_code=400, detail="Client not found. Cannot create appointment.")
+        raise HTTPException(status_code=409, detail="Horário indisponível para este barbeiro")
+    bump_versions(db, "Appointments")
+    db.commit()
+    return db_appointment
+
+def get_appointment(db: Session, appointment_id: int):
+    return db.query(models.Appointments).filter(models.Appointments.id_appointment == appointment_id).first()
+
+def get_all_appointments(db: Session, limit: int | None = None, after: int | None = None, id_barber: int | None = None, id_client: int | None = None, start: datetime | None = None, end: datetime | None = None):
+    query = db.query(models.Appointments)
+    if id_barber is not None:
+        query = query.filter(models.Appointments.id_barber == id_barber)
+    if id_client is not None:
+        query = query.filter(models.Appointments.id_client == id_client)
+    if start is not None:
+        query = query.filter(models.Appointments.start_at >= local_datetime(start))
+    if end is not None:
+        query = query.filter(models.Appointments.start_at < local_datetime(end))
+    return _keyset(query, models.Appointments.id_appointment, limit, after).all()
+
+def delete_appointment(db: Session, appointment_id: int):
+    if _delete_row(db, models.Appointments, models.Appointments.id_appointment, appointment_id) is None:
+        db.rollback()
+        return False
+    bump_versions(db, "Appointments")
+    db.commit()
+    return True
@@ -1,11 +1,307 @@
+import asyncio
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from config import SQLALCHEMY_DATABASE_URL
 from dotenv import load_dotenv
 import os
+import config
+from metrics import LatencyWindow, instrument_engine
+import profiler
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"options": "-c client_encoding=UTF8"})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# When enabled, requests get an AsyncSession on an async driver (asyncpg / aiosqlite)
+DB_ASYNC = getattr(config, "DB_ASYNC", False)
+
+DB_POOL_SIZE = getattr(config, "DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = getattr(config, "DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = getattr(config, "DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = getattr(config, "DB_POOL_RECYCLE", -1)
+DB_POOL_PRE_PING = getattr(config, "DB_POOL_PRE_PING", False)
+DB_POOL_WAIT_SAMPLES = getattr(config, "DB_POOL_WAIT_SAMPLES", 2048)
+METRICS_ENABLED = getattr(config, "METRICS_ENABLED", True)
+
+# Time spent waiting for a pooled connection, including opening new overflow connections
+pool_wait_times = LatencyWindow(DB_POOL_WAIT_SAMPLES)
+
+class _TimedCheckoutMixin:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait_times.observe(time.perf_counter() - start)
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+def _async_url(url: str):
+    if url.startswith("sqlite"):
+        return url.replace("sqlite", "sqlite+aiosqlite", 1)
+    if url.startswith("postgresql"):
+        return "postgresql+asyncpg" + url[url.index(":"):]
+    return url
+
+def _connect_args(url: str):
+    if url.startswith("postgresql") and "+asyncpg" not in url:
+        return {"options": "-c client_encoding=UTF8"}
+    if url.startswith("sqlite"):
+        return {"check_same_thread": False}
+    return {}
+
+def _pool_args(url: str, poolclass):
+    args = {"pool_recycle": DB_POOL_RECYCLE, "pool_pre_ping": DB_POOL_PRE_PING}
+    # In-memory SQLite keeps its single-connection pool
+    if url.startswith("sqlite") and (":memory:" in url or url.split("://", 1)[1] in ("", "/")):
+        return args
+    args.update(
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return args
+
+SQLALCHEMY_ASYNC_DATABASE_URL = getattr(config, "SQLALCHEMY_ASYNC_DATABASE_URL", None) or _async_url(SQLALCHEMY_DATABASE_URL)
+
+# Optional read replica: GET requests read from it (see dependencies.get_db), writes always
+# go to the primary. A replica that fails to hand out a connection is skipped for
+# DB_REPLICA_RETRY_SECONDS, during which reads fall back to the primary.
+DB_REPLICA_URL = getattr(config, "DB_REPLICA_URL", None)
+SQLALCHEMY_ASYNC_REPLICA_URL = getattr(config, "SQLALCHEMY_ASYNC_REPLICA_URL", None) or (DB_REPLICA_URL and _async_url(DB_REPLICA_URL))
+DB_REPLICA_RETRY_SECONDS = getattr(config, "DB_REPLICA_RETRY_SECONDS", 30)
+# After a write, the same client reads from the primary for this long (0 disables)
+DB_READ_YOUR_WRITES_SECONDS = getattr(config, "DB_READ_YOUR_WRITES_SECONDS", 5)
+
+# Engines are created lazily by init_engine() (called from the app lifespan, scripts and
+# get_db), so importing the app never opens a connection. The sessionmakers exist from
+# import time and are bound once the engine is up.
+engine = None
+async_engine = None
+replica_engine = None
+async_replica_engine = None
+# Rows returned by a write are already current (RETURNING), so commit does not expire them
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+AsyncSessionLocal = None
+AsyncReplicaSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    # expire_on_commit=False so returned rows can be serialized outside the greenlet without lazy loads
+    AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+    AsyncReplicaSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# Replica connections refuse writes at the database, so a write issued on a GET path fails
+# instead of landing on the replica: default_transaction_read_only on Postgres,
+# PRAGMA query_only on SQLite, a read-only session on MySQL
+def _read_only_connect_args(url: str):
+    args = _connect_args(url)
+    if url.startswith("postgresql") and "+asyncpg" in url:
+        args["server_settings"] = {"default_transaction_read_only": "on"}
+    elif url.startswith("postgresql"):
+        args["options"] = args.get("options", "") + " -c default_transaction_read_only=on"
+    return args
+
+# SQLite replicas are also opened with mode=ro, so a missing file fails to connect instead of
+# being created empty, and the header is read at connect so a file that is not a database
+# fails there too; both then count as the replica being down rather than as a failed request
+def _read_only_url(url: str):
+    if not url.startswith("sqlite") or ":///" not in url or ":memory:" in url or "uri=true" in url:
+        return url
+    scheme, path = url.split(":///", 1)
+    return f"{scheme}:///file:{path}?mode=ro&uri=true"
+
+def _make_read_only(engine):
+    from sqlalchemy import event
+    statements = {
+        "sqlite": ("PRAGMA query_only = ON", "PRAGMA schema_version"),
+        "mysql": ("SET SESSION TRANSACTION READ ONLY",),
+    }.get(engine.dialect.name)
+    if statements is None:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+def _create_engines(url: str, async_url: str | None, read_only: bool = False, **options):
+    connect_args = _read_only_connect_args if read_only else _connect_args
+    if read_only:
+        url, async_url = _read_only_url(url), async_url and _read_only_url(async_url)
+    sync_engine = create_engine(url, connect_args=connect_args(url), **{**_pool_args(url, TimedQueuePool), **options})
+    if read_only:
+        _make_read_only(sync_engine)
+    if METRICS_ENABLED:
+        instrument_engine(sync_engine)
+    if profiler.SQL_PROFILE:
+        profiler.instrument_engine(sync_engine)
+    if not DB_ASYNC:
+        return sync_engine, None
+    async_engine = create_async_engine(async_url, connect_args=connect_args(async_url), **{**_pool_args(async_url, TimedAsyncAdaptedQueuePool), **options})
+    if read_only:
+        _make_read_only(async_engine.sync_engine)
+    if METRICS_ENABLED:
+        instrument_engine(async_engine.sync_engine)
+    if profiler.SQL_PROFILE:
+        profiler.instrument_engine(async_engine.sync_engine)
+    return sync_engine, async_engine
+
+def init_engine():
+    global engine, async_engine, replica_engine, async_replica_engine
+    if engine is not None:
+        return engine
+    sync_engine, async_engine = _create_engines(SQLALCHEMY_DATABASE_URL, SQLALCHEMY_ASYNC_DATABASE_URL)
+    SessionLocal.configure(bind=sync_engine)
+    if DB_ASYNC:
+        AsyncSessionLocal.configure(bind=async_engine)
+    if DB_REPLICA_URL:
+        # pre_ping so a replica that went away is noticed at checkout, where get_db can still fall back
+        replica_engine, async_replica_engine = _create_engines(DB_REPLICA_URL, SQLALCHEMY_ASYNC_REPLICA_URL, read_only=True, pool_pre_ping=True)
+        ReplicaSessionLocal.configure(bind=replica_engine)
+        if DB_ASYNC:
+            AsyncReplicaSessionLocal.configure(bind=async_replica_engine)
+    engine = sync_engine
+    return engine
+
+def get_engine():
+    return init_engine()
+
+# The engine requests run on: the async engine's sync core when DB_ASYNC, else the sync engine
+def get_request_engine():
+    init_engine()
+    return async_engine.sync_engine if async_engine is not None else engine
+
+#------
+#READ REPLICA
+#------
+
+class ReplicaHealth:
+    def __init__(self, retry_seconds: float):
+        self.retry_seconds = retry_seconds
+        self.down_until = 0.0
+        self.reads = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.last_error = None
+
+    def available(self):
+        return bool(DB_REPLICA_URL) and time.monotonic() >= self.down_until
+
+    def mark_down(self, error: Exception):
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"[:200]
+        self.down_until = time.monotonic() + self.retry_seconds
+
+    def stats(self):
+        return {
+            "configured": bool(DB_REPLICA_URL),
+            "available": self.available(),
+            "retry_in_seconds": max(0.0, round(self.down_until - time.monotonic(), 1)),
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+replica_health = ReplicaHealth(DB_REPLICA_RETRY_SECONDS)
+
+# A session for read-only work: on the replica when it is configured and up, otherwise on
+# the primary. The connection is checked out here, so an unreachable replica turns into a
+# fallback instead of a failed request.
+def open_read_session(use_replica: bool = True):
+    init_engine()
+    if not use_replica or not DB_REPLICA_URL:
+        return SessionLocal()
+    if replica_health.available():
+        db = ReplicaSessionLocal()
+        try:
+            db.connection()
+            replica_health.reads += 1
+            return db
+        except (DBAPIError, OSError) as error:
+            db.close()
+            replica_health.mark_down(error)
+    replica_health.fallbacks += 1
+    return SessionLocal()
+
+async def open_read_session_async(use_replica: bool = True):
+    init_engine()
+    if not use_replica or not DB_REPLICA_URL:
+        return AsyncSessionLocal()
+    if replica_health.available():
+        db = AsyncReplicaSessionLocal()
+        try:
+            await db.connection()
+            replica_health.reads += 1
+            return db
+        except (DBAPIError, OSError) as error:
+            await db.close()
+            replica_health.mark_down(error)
+    replica_health.fallbacks += 1
+    return AsyncSessionLocal()
+
+#------
+#POOL WARM-UP
+#------
+
+# Opens up to DB_POOL_PREWARM connections at startup and returns them to the pool, so the
+# first requests after a (re)start do not pay for the connect handshakes
+DB_POOL_PREWARM = getattr(config, "DB_POOL_PREWARM", DB_POOL_SIZE)
+
+def _warm(bind, n: int):
+    connections = []
+    try:
+        for _ in range(n):
+            connections.append(bind.connect())
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+async def _warm_async(bind, n: int):
+    connections = []
+    try:
+        for _ in range(n):
+            connections.append(await bind.connect())
+    finally:
+        for conn in connections:
+            await conn.close()
+    return len(connections)
+
+async def _warm_bind(bind, n: int):
+    if DB_ASYNC:
+        return await _warm_async(bind, n)
+    return await asyncio.to_thread(_warm, bind, n)
+
+# A replica that cannot be reached at startup is only marked down; the primary must connect
+async def warm_pool(n: int = DB_POOL_PREWARM):
+    init_engine()
+    n = min(n, DB_POOL_SIZE)
+    if n <= 0:
+        return 0
+    primary, replica = (async_engine, async_replica_engine) if DB_ASYNC else (engine, replica_engine)
+    warmed = await _warm_bind(primary, n)
+    if replica is not None:
+        try:
+            await _warm_bind(replica, n)
+        except (DBAPIError, OSError) as error:
+            replica_health.mark_down(error)
+    return warmed
+
+async def dispose_engines():
+    for async_bind in (async_engine, async_replica_engine):
+        if async_bind is not None:
+            await async_bind.dispose()
+    for bind in (engine, replica_engine):
+        if bind is not None:
+            bind.dispose()
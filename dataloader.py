@@ -0,0 +1,57 @@
+import asyncio
+
+# Coalesces lookups by key: every load() issued during the same event-loop turn is resolved
+# by a single call to batch_fn(keys) -> {key: value}. Keys are deduplicated and results
+# memoized for the loader's lifetime, which is one request (see dependencies.get_loaders).
+class DataLoader:
+    # `empty` builds the value for keys batch_fn returned nothing for (e.g. list); None otherwise
+    def __init__(self, batch_fn, empty=None):
+        self.batch_fn = batch_fn
+        self.empty = empty
+        self.batches = 0
+        self._futures = {}
+        self._queue = []
+        # The event loop only keeps weak references to tasks; these are held until they finish
+        self._tasks = set()
+
+    def load(self, key):
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._queue:
+                # Runs after the already scheduled tasks, so siblings in a gather() join this batch
+                loop.call_soon(self._dispatch)
+            self._queue.append(key)
+        return future
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        self.batches += 1
+        task = asyncio.ensure_future(self._resolve(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Futures whose awaiting caller was cancelled are already done and are skipped, so one
+    # abandoned load never breaks the rest of its batch
+    async def _resolve(self, keys):
+        try:
+            results = await self.batch_fn(keys)
+        except BaseException as exc:
+            for key in keys:
+                if not self._futures[key].done():
+                    self._futures[key].set_exception(exc)
+            if not isinstance(exc, Exception):
+                raise
+            return
+        for key in keys:
+            future = self._futures[key]
+            if future.done():
+                continue
+            if key in results:
+                future.set_result(results[key])
+            else:
+                future.set_result(self.empty() if self.empty is not None else None)
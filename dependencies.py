@@ -1,20 +1,76 @@
-from fastapi import Depends, HTTPException, status
+import asyncio
+import time
+from datetime import date
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
 import config, crud, models, schemas
-from database import SessionLocal
+from database import (
+    SessionLocal, AsyncSessionLocal, DB_ASYNC, DB_REPLICA_URL, DB_READ_YOUR_WRITES_SECONDS,
+    init_engine, open_read_session, open_read_session_async,
+)
+from cache import principal_cache
+from dataloader import DataLoader
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_db():
-    db = SessionLocal()
+READ_METHODS = {"GET", "HEAD"}
+# POST routes that write nothing: batch-by-ids lookups carry their ids in the body, and
+# login only touches the caller's own user row
+READ_ONLY_POSTS = {"/login", "/clients/batch", "/clients/batch/profiles", "/subscriptions/by-clients", "/adress/by-clients"}
+# Set on every mutating request while a replica is configured; until it expires, that
+# client's reads stay on the primary and see their own writes despite replication lag
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+def reads_from_replica(request: Request):
+    if not DB_REPLICA_URL or request.method not in READ_METHODS:
+        return False
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) <= time.time()
+    except ValueError:
+        return True
+
+def _writes(request: Request):
+    if request.method in READ_METHODS:
+        return False
+    route = request.scope.get("route")
+    return not (request.method == "POST" and getattr(route, "path", None) in READ_ONLY_POSTS)
+
+def _pin_to_primary(request: Request, response: Response):
+    if DB_REPLICA_URL and DB_READ_YOUR_WRITES_SECONDS and _writes(request):
+        until = time.time() + DB_READ_YOUR_WRITES_SECONDS
+        response.set_cookie(PRIMARY_PIN_COOKIE, f"{until:.3f}", max_age=max(1, round(DB_READ_YOUR_WRITES_SECONDS)), httponly=True, samesite="lax")
+
+# GET/HEAD requests get a session on the read replica (falling back to the primary when it
+# is down or the client just wrote); everything else gets a primary session
+async def get_db(request: Request, response: Response):
+    # Normally already done by the app lifespan; a no-op after the first call
+    init_engine()
+    _pin_to_primary(request, response)
+    use_replica = reads_from_replica(request)
+    if DB_ASYNC:
+        db = await open_read_session_async() if use_replica else AsyncSessionLocal()
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+    db = await run_in_threadpool(open_read_session) if use_replica else SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
+
+# Runs a crud function against whichever session get_db handed out: on the async
+# driver through AsyncSession.run_sync, otherwise on the threadpool.
+async def run_db(db, fn, *args, **kwargs):
+    if DB_ASYNC:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -28,7 +84,51 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = crud.get_user(db, login=token_data.username)
-    if user is None:
+    user = principal_cache.get(token_data.username)
+    if user is not None:
+        return user
+    db_user = await run_db(db, crud.get_user, login=token_data.username)
+    if db_user is None:
         raise credentials_exception
+    user = schemas.UsersRead.model_validate(db_user)
+    principal_cache.set(token_data.username, user)
     return user
+
+def _etag_matches(etag: str, if_none_match: str | None):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+# ETag built from the version counters of the tables an endpoint reads. A matching
+# If-None-Match is answered with 304 before the endpoint runs its query, so polling an
+# unchanged collection costs one primary-key lookup. `daily` folds today's date in for
+# endpoints whose result moves with the calendar (active/expiring subscriptions).
+def conditional(*tables: str, daily: bool = False):
+    async def check(request: Request, response: Response, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+        versions = await run_db(db, crud.get_table_versions, tables)
+        if daily:
+            versions.append(date.today().toordinal())
+        etag = 'W/"' + "-".join(str(version) for version in versions) + '"'
+        if _etag_matches(etag, request.headers.get("if-none-match")):
+            raise HTTPException(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+    return Depends(check)
+
+# Per-request loaders for the batch endpoints. Loads issued concurrently within a request
+# coalesce into one IN query per entity type; the batches share the request's session and
+# take turns on it.
+class RequestLoaders:
+    def __init__(self, db):
+        self.db = db
+        self._db_lock = asyncio.Lock()
+        self.clients = DataLoader(lambda ids: self._run(crud.get_clients_by_ids, ids))
+        self.adresses = DataLoader(lambda ids: self._run(crud.get_adresses_by_clients, ids), empty=list)
+        self.subscriptions = DataLoader(lambda ids: self._run(crud.get_subscriptions_by_clients, ids), empty=list)
+
+    async def _run(self, fn, ids):
+        async with self._db_lock:
+            return await run_db(self.db, fn, ids)
+
+def get_loaders(db: Session = Depends(get_db)):
+    return RequestLoaders(db)
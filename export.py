@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from sqlalchemy import select
+import config, models
+from database import DB_ASYNC, open_read_session, open_read_session_async
+
+EXPORT_CHUNK_SIZE = getattr(config, "EXPORT_CHUNK_SIZE", 1000)
+
+EXPORT_TABLES = {
+    "clients": (models.Clients.__table__, "id_client"),
+    "adress": (models.Adress.__table__, "id_adress"),
+    "subscriptions": (models.Subscriptions.__table__, "id_subscription"),
+}
+
+# Internal columns that are not part of the exported records
+EXPORT_EXCLUDED_COLUMNS = {"name_search"}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _encode_ndjson(rows):
+    return "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+def _encode_csv(rows, columns, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([row[column] for column in columns] for row in rows)
+    return buffer.getvalue()
+
+# Two IN queries per chunk of clients, never one per client
+def _attach_related(db, rows):
+    ids = [row["id_client"] for row in rows]
+    adresses = defaultdict(list)
+    for adress in db.execute(select(models.Adress.__table__).where(models.Adress.id_client.in_(ids))).mappings():
+        adresses[adress["id_client"]].append(dict(adress))
+    subscriptions = defaultdict(list)
+    for subscription in db.execute(select(models.Subscriptions.__table__).where(models.Subscriptions.id_client.in_(ids))).mappings():
+        subscriptions[subscription["id_client"]].append(dict(subscription))
+    for row in rows:
+        row["adresses"] = adresses[row["id_client"]]
+        row["subscriptions"] = subscriptions[row["id_client"]]
+    return rows
+
+def _export_statement(resource: str):
+    table, pk = EXPORT_TABLES[resource]
+    columns = [column for column in table.c if column.name not in EXPORT_EXCLUDED_COLUMNS]
+    # yield_per turns on a server-side cursor (stream_results) so rows arrive chunk by chunk
+    return select(*columns).order_by(table.c[pk]).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+
+def _encode(rows, columns, fmt: str, first: bool):
+    if fmt == "csv":
+        return _encode_csv(rows, columns, header=first)
+    return _encode_ndjson(rows)
+
+# The export owns its sessions instead of borrowing the request's, since the
+# response body keeps streaming after the endpoint has returned. They read from the
+# replica when the request would have.
+def stream_export(resource: str, fmt: str, include_related: bool = False, use_replica: bool = False):
+    db = open_read_session(use_replica)
+    related_db = open_read_session(use_replica) if include_related else None
+    try:
+        result = db.execute(_export_statement(resource))
+        columns = list(result.keys())
+        first = True
+        for partition in result.partitions():
+            rows = [dict(row._mapping) for row in partition]
+            if include_related:
+                _attach_related(related_db, rows)
+            yield _encode(rows, columns, fmt, first)
+            first = False
+        if first and fmt == "csv":
+            yield _encode_csv([], columns, header=True)
+    finally:
+        db.close()
+        if related_db is not None:
+            related_db.close()
+
+async def stream_export_async(resource: str, fmt: str, include_related: bool = False, use_replica: bool = False):
+    db = await open_read_session_async(use_replica)
+    related_db = await open_read_session_async(use_replica) if include_related else None
+    try:
+        result = await db.stream(_export_statement(resource))
+        columns = list(result.keys())
+        first = True
+        async for partition in result.partitions():
+            rows = [dict(row._mapping) for row in partition]
+            if include_related:
+                await related_db.run_sync(_attach_related, rows)
+            yield _encode(rows, columns, fmt, first)
+            first = False
+        if first and fmt == "csv":
+            yield _encode_csv([], columns, header=True)
+    finally:
+        await db.close()
+        if related_db is not None:
+            await related_db.close()
+
+def export_rows(resource: str, fmt: str, include_related: bool = False, use_replica: bool = False):
+    if DB_ASYNC:
+        return stream_export_async(resource, fmt, include_related, use_replica)
+    return stream_export(resource, fmt, include_related, use_replica)
@@ -0,0 +1,98 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+import config
+from metrics import LatencyWindow
+
+# Kept free of app imports: worker processes are spawned and only load this module
+
+BCRYPT_ROUNDS = getattr(config, "BCRYPT_ROUNDS", 12)
+# 0 runs hashing on the event loop's default thread executor instead of worker processes
+PASSWORD_HASH_WORKERS = getattr(config, "PASSWORD_HASH_WORKERS", os.cpu_count() or 1)
+PASSWORD_HASH_CONCURRENCY = getattr(config, "PASSWORD_HASH_CONCURRENCY", max(PASSWORD_HASH_WORKERS, 1))
+PASSWORD_HASH_MAX_QUEUE = getattr(config, "PASSWORD_HASH_MAX_QUEUE", 256)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+def hash_password(password: str):
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str):
+    return pwd_context.verify(plain_password, hashed_password)
+
+# bcrypt hashes look like $2b$12$<salt+digest>; the second field is the cost
+def needs_rehash(hashed_password: str):
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+class HashPool:
+    def __init__(self, workers: int, concurrency: int, max_queue: int):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self.wait_times = LatencyWindow()
+        self.run_times = LatencyWindow()
+        self._executor = None
+        self._loop = None
+        self._semaphore = None
+
+    def _get_executor(self):
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def run(self, fn, *args):
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many concurrent logins, try again")
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.perf_counter()
+        self.wait_times.observe(started_at - queued_at)
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.running -= 1
+            self.run_times.observe(time.perf_counter() - started_at)
+            semaphore.release()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "rejected": self.rejected,
+            "queue_wait_seconds": self.wait_times.summary(),
+            "hash_seconds": self.run_times.summary(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+hash_pool = HashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_MAX_QUEUE)
@@ -1,18 +1,53 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Response
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, UploadFile, File, Query
+from pydantic import ValidationError
+import asyncio, csv, io
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, date
 import models, schemas, crud, auth, config
-from dependencies import get_db, get_current_user
-from database import engine
+from dependencies import get_db, get_current_user, run_db, conditional, get_loaders, reads_from_replica, RequestLoaders
+from fastapi.concurrency import run_in_threadpool
+from database import init_engine, get_request_engine, warm_pool, dispose_engines, pool_wait_times, replica_health, METRICS_ENABLED
 from auth import verify_token
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
-from fastapi.responses import JSONResponse
-
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
+from typing import Dict, List, Literal
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from cache import principal_cache, client_cache
+from hashing import hash_pool
+from metrics import pool_status, request_metrics, MetricsMiddleware
+import profiler
+from profiler import sql_profile, ProfilerMiddleware, SQL_PROFILE, SQL_PROFILE_DUMP_PATH, SQL_PROFILE_TOP_N
+from pagination import PageParams, paginate
+from export import export_rows, MEDIA_TYPES
+from search import search_clients, warm_index
+from serialization import list_response, groups_response, model_response
+import reporting
+from availability import availability, APPOINTMENT_SLOT_MINUTES, APPOINTMENT_MAX_MINUTES, AVAILABILITY_MAX_DAYS
+
+# Schema changes are applied by `python migrations.py`; DB_AUTO_MIGRATE runs them at startup instead
+# (safe with several workers on Postgres and SQLite, see migrations.py)
+DB_AUTO_MIGRATE = getattr(config, "DB_AUTO_MIGRATE", False)
+
+# Nothing touches the database at import time: the engine is created, its pool pre-warmed
+# and the client search index built here, once per worker, before the first request is accepted
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_engine()
+    if DB_AUTO_MIGRATE:
+        import migrations
+        await run_in_threadpool(migrations.upgrade)
+    await warm_pool()
+    await run_in_threadpool(warm_index)
+    try:
+        yield
+    finally:
+        hash_pool.shutdown()
+        await dispose_engines()
+        if SQL_PROFILE and SQL_PROFILE_DUMP_PATH:
+            profiler.dump(SQL_PROFILE_DUMP_PATH)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,8 +55,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+if SQL_PROFILE:
+    app.add_middleware(ProfilerMiddleware)
+
 origins = [ #No fim, alterar origins para somente o ip que irá fazer a requisição
     "http://localhost:3000",
 ]
@@ -31,15 +73,16 @@ origins = [ #No fim, alterar origins para somente o ip que irá fazer a requisi
 #------
 
 @app.post("/register", response_model=schemas.UsersRead, tags=["Authentication"])
-def register(user: schemas.UsersCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    db_user = crud.get_user(db, login=user.login)
+async def register(user: schemas.UsersCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    db_user = await run_db(db, crud.get_user, login=user.login)
     if db_user:
         raise HTTPException(status_code=400, detail="Login already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await auth.get_password_hash_async(user.password)
+    return await run_db(db, crud.create_user, user=user, hashed_password=hashed_password)
 
 @app.post("/login", response_model=schemas.Token, tags=["Authentication"])
-def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -60,7 +103,7 @@ async def verify_user_token(token: str):
     return {"message": "Token is valid"}
 
 @app.get("/me", response_model=schemas.UsersRead, tags=["Authentication"])
-def read_users_me(current_user: schemas.UsersRead = Depends(get_current_user)):
+async def read_users_me(current_user: schemas.UsersRead = Depends(get_current_user)):
     return current_user
 
 #------
@@ -68,28 +111,93 @@ def read_users_me(current_user: schemas.UsersRead = Depends(get_current_user)):
 #------
 
 @app.post("/register_client", response_model=schemas.ClientRead, tags=["Client"])
-def register_client(client: schemas.ClientCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+async def register_client(client: schemas.ClientCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
     
-    db_client = crud.get_client(db, cpf=client.cpf)
-    if db_client:
+    db_client = await run_db(db, crud.create_client, client=client)
+    if db_client is None:
         raise HTTPException(status_code=400, detail="Client already registered")
     
-    return crud.create_client(db=db, client=client)
+    return db_client
+
+@app.put("/client", response_model=schemas.ClientRead, tags=["Client"])
+async def upsert_client(client: schemas.ClientCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    return await run_db(db, crud.upsert_client, client=client)
 
 
-@app.get("/client/{cpf}", response_model=schemas.ClientRead, tags=["Client"])
-def read_client(cpf: str, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+@app.get("/client/{cpf}", response_model=schemas.ClientRead, tags=["Client"], dependencies=[conditional("Clients")])
+async def read_client(cpf: str, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
 
-    client = crud.get_client(db, cpf=cpf)
+    client = await run_db(db, crud.get_client, cpf=cpf)
 
     if client is None:
         raise HTTPException(status_code=404, detail="Client not found")
 
     return client
 
-@app.get("/client/", response_model=schemas.ClientRead, tags=["Client"])
-def read_client(name: str, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    client = crud.get_client_by_name(db, name=name)
+def _import_report(rows: list):
+    rows.sort(key=lambda r: r["row"])
+    counts = {"created": 0, "duplicate": 0, "invalid": 0}
+    for r in rows:
+        counts[r["status"]] += 1
+    return {"created": counts["created"], "duplicates": counts["duplicate"], "invalid": counts["invalid"], "rows": rows}
+
+def _parse_clients_csv(content: bytes):
+    valid, invalid = [], []
+    reader = csv.DictReader(io.StringIO(content.decode("utf-8-sig")))
+    for row_number, row in enumerate(reader, start=1):
+        try:
+            valid.append((row_number, schemas.ClientCreate.model_validate(row)))
+        except ValidationError as e:
+            invalid.append({"row": row_number, "cpf": row.get("cpf"), "status": "invalid", "detail": str(e.errors()[0]["msg"])})
+    return valid, invalid
+
+@app.post("/clients/import", response_model=schemas.ClientImportReport, tags=["Client"])
+async def import_clients(clients: List[schemas.ClientCreate], db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    rows = await run_db(db, crud.import_clients, list(enumerate(clients, start=1)))
+    return _import_report(rows)
+
+@app.post("/clients/import/csv", response_model=schemas.ClientImportReport, tags=["Client"])
+async def import_clients_csv(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    valid, invalid = await run_in_threadpool(_parse_clients_csv, await file.read())
+    rows = await run_db(db, crud.import_clients, valid)
+    return _import_report(rows + invalid)
+
+@app.get("/clients/", response_model=List[schemas.ClientRead], tags=["Client"], dependencies=[conditional("Clients")])
+async def read_clients(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    clients = await run_db(db, crud.get_all_clients, limit=page.limit + 1, after=page.after)
+    return list_response(schemas.ClientRead, paginate(response, clients, page.limit, "id_client"), response)
+
+@app.get("/clients/search", response_model=List[schemas.ClientRead], tags=["Client"], dependencies=[conditional("Clients")])
+async def search_clients_endpoint(response: Response, q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0), db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    return list_response(schemas.ClientRead, await run_db(db, search_clients, q, limit, offset), response)
+
+@app.post("/clients/batch", response_model=List[schemas.ClientRead], tags=["Client"])
+async def read_clients_batch(batch: schemas.ClientIds, loaders: RequestLoaders = Depends(get_loaders), current_user: schemas.UsersRead = Depends(get_current_user)):
+    clients = await loaders.clients.load_many(batch.ids)
+    return list_response(schemas.ClientRead, [client for client in clients if client is not None])
+
+# Each id resolves its client, addresses and subscriptions concurrently; the loaders fold
+# all of them into three queries in total
+@app.post("/clients/batch/profiles", response_model=List[schemas.ClientProfile], tags=["Client"])
+async def read_client_profiles_batch(batch: schemas.ClientIds, loaders: RequestLoaders = Depends(get_loaders), current_user: schemas.UsersRead = Depends(get_current_user)):
+    async def profile(client_id: int):
+        client, adresses, subscriptions = await asyncio.gather(
+            loaders.clients.load(client_id), loaders.adresses.load(client_id), loaders.subscriptions.load(client_id)
+        )
+        return crud.attach_profile(client, adresses, subscriptions) if client is not None else None
+    profiles = await asyncio.gather(*(profile(client_id) for client_id in batch.ids))
+    return list_response(schemas.ClientProfile, [p for p in profiles if p is not None])
+
+@app.get("/client/{cpf}/profile", response_model=schemas.ClientProfile, tags=["Client"], dependencies=[conditional("Clients", "Adress", "Subscriptions")])
+async def read_client_profile(cpf: str, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    client = await run_db(db, crud.get_client_profile, cpf=cpf)
+    if client is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return client
+
+@app.get("/client/", response_model=schemas.ClientRead, tags=["Client"], dependencies=[conditional("Clients")])
+async def read_client(name: str, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    client = await run_db(db, crud.get_client_by_name, name=name)
     
     if client is None:
         raise HTTPException(status_code=404, detail="Client not found")
@@ -97,107 +205,137 @@ def read_client(name: str, db: Session = Depends(get_db), current_user: schemas.
     return client
 
 @app.patch("/client/{client_id}", response_model=schemas.ClientRead, tags=["Client"])
-def update_client(client_id: int, client_update: schemas.ClientUpdate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    
-    db_client = crud.get_client_by_id(db, client_id)
-    if not db_client:
+async def update_client(client_id: int, client_update: schemas.ClientUpdate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    updated_client = await run_db(db, crud.update_client, client_id, client_update)
+    if not updated_client:
         raise HTTPException(status_code=404, detail="Client not found")
-    
-    updated_client = crud.update_client(db, db_client, client_update)
-    
+
     return updated_client
 
 @app.delete("/client/{client_id}", response_model=schemas.ClientRead, tags=["Client"])
-def delete_client(client_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+async def delete_client(client_id: int, archive: bool = False, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
     
-    return crud.delete_client(db, client_id)
+    return await run_db(db, crud.delete_client, client_id, archive=archive)
 
 #------
 # SUBSCRIPTIONS ENDPOINTS
 #------
 
 @app.post("/subscriptions", response_model=schemas.SubscriptionRead, tags=["Subscription"])
-def register_subscription(subscription: schemas.SubscriptionCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    
-    client = crud.get_client_by_id(db, subscription.id_client)
-    if not client:
+async def register_subscription(subscription: schemas.SubscriptionCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    db_subscription = await run_db(db, crud.create_subscription, subscription=subscription)
+    if not db_subscription:
         raise HTTPException(status_code=400, detail="Client not found. Cannot create subscription.")
 
-    return crud.create_subscription(db=db, subscription=subscription)
+    return db_subscription
+
 
+@app.get("/subscriptions", response_model=List[schemas.SubscriptionRead], tags=["Subscription"], dependencies=[conditional("Subscriptions")])
+async def read_subscriptions(response: Response, page: PageParams = Depends(), id_client: int | None = None, payment_method: str | None = None, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    subscriptions = await run_db(db, crud.get_all_subscriptions, limit=page.limit + 1, after=page.after, id_client=id_client, payment_method=payment_method)
+    return list_response(schemas.SubscriptionRead, paginate(response, subscriptions, page.limit, "id_subscription"), response)
+
+@app.get("/subscriptions/active", response_model=List[schemas.SubscriptionRead], tags=["Subscription"], dependencies=[conditional("Subscriptions", daily=True)])
+async def read_active_subscriptions(response: Response, as_of: date | None = None, page: PageParams = Depends(), db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    subscriptions = await run_db(db, crud.get_active_subscriptions, as_of or date.today(), limit=page.limit + 1, after=page.after)
+    return list_response(schemas.SubscriptionRead, paginate(response, subscriptions, page.limit, "id_subscription"), response)
+
+@app.get("/subscriptions/expiring", response_model=List[schemas.SubscriptionRead], tags=["Subscription"], dependencies=[conditional("Subscriptions", daily=True)])
+async def read_expiring_subscriptions(response: Response, days: int = Query(7, ge=0), as_of: date | None = None, page: PageParams = Depends(), db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    subscriptions = await run_db(db, crud.get_expiring_subscriptions, as_of or date.today(), days, limit=page.limit + 1, after=page.after)
+    return list_response(schemas.SubscriptionRead, paginate(response, subscriptions, page.limit, "id_subscription"), response)
+
+@app.get("/subscriptions/expired", response_model=List[schemas.SubscriptionRead], tags=["Subscription"], dependencies=[conditional("Subscriptions", daily=True)])
+async def read_expired_subscriptions(response: Response, since: date, as_of: date | None = None, page: PageParams = Depends(), db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    subscriptions = await run_db(db, crud.get_expired_subscriptions, as_of or date.today(), since, limit=page.limit + 1, after=page.after)
+    return list_response(schemas.SubscriptionRead, paginate(response, subscriptions, page.limit, "id_subscription"), response)
+
+@app.get("/subscriptions/client/{client_id}/current", response_model=schemas.SubscriptionRead, tags=["Subscription"], dependencies=[conditional("Subscriptions", daily=True)])
+async def read_current_subscription(client_id: int, as_of: date | None = None, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    subscription = await run_db(db, crud.get_current_subscription, client_id, as_of or date.today())
+    if subscription is None:
+        raise HTTPException(status_code=404, detail="Nenhuma assinatura ativa para este cliente.")
+    return subscription
 
-@app.get("/subscription/{subscription_id}", response_model=List[schemas.SubscriptionRead], tags=["Subscription"])
-def read_subscription(subscription_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+@app.get("/subscription/{subscription_id}", response_model=schemas.SubscriptionRead, tags=["Subscription"], dependencies=[conditional("Subscriptions")])
+async def read_subscription(subscription_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
 
-    subscription = crud.get_subscription_by_id(db, subscription_id)
+    subscription = await run_db(db, crud.get_subscription_by_id, subscription_id)
 
     if subscription is None:
         raise HTTPException(status_code=404, detail="Subscription not found")
 
     return subscription
 
-@app.get("/subscriptions/client/{client_id}", response_model=List[schemas.SubscriptionRead], tags=["Subscription"])
-def read_subscriptions_by_client(client_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    subscriptions = db.query(models.Subscriptions).filter(models.Subscriptions.id_client == client_id).all()
+@app.post("/subscriptions/by-clients", response_model=Dict[int, List[schemas.SubscriptionRead]], tags=["Subscription"])
+async def read_subscriptions_by_clients(batch: schemas.ClientIds, loaders: RequestLoaders = Depends(get_loaders), current_user: schemas.UsersRead = Depends(get_current_user)):
+    groups = await loaders.subscriptions.load_many(batch.ids)
+    return groups_response(schemas.SubscriptionRead, dict(zip(batch.ids, groups)))
+
+@app.get("/subscriptions/client/{client_id}", response_model=List[schemas.SubscriptionRead], tags=["Subscription"], dependencies=[conditional("Subscriptions")])
+async def read_subscriptions_by_client(client_id: int, response: Response, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    subscriptions = await run_db(db, crud.get_subscriptions_by_client, client_id)
     
     if not subscriptions:
         raise HTTPException(status_code=404, detail="Nenhuma assinatura encontrada para este cliente.")
 
-    return [schemas.SubscriptionRead.model_validate(sub) for sub in subscriptions]  # 🔹 Converte para schema correto
+    return list_response(schemas.SubscriptionRead, subscriptions, response)
 
 @app.patch("/subscription/{subscription_id}", response_model=schemas.SubscriptionRead, tags=["Subscription"])
-def update_subscription(subscription_id: int, subscription_update: schemas.SubscriptionCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    
-    db_subscription = crud.get_subscription_by_id(db, subscription_id)
-    if not db_subscription:
+async def update_subscription(subscription_id: int, subscription_update: schemas.SubscriptionCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    updated_subscription = await run_db(db, crud.update_subscription, subscription_id, subscription_update)
+    if not updated_subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
-    
-    updated_subscription = crud.update_subscription(db, db_subscription, subscription_update)
-    
+
     return updated_subscription
 
 @app.delete("/subscriptions/{subscription_id}", response_model=schemas.SubscriptionRead, tags=["Subscription"])
-def delete_subscription(subscription_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+async def delete_subscription(subscription_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
 
-    return crud.delete_subscription(db, subscription_id)
+    return await run_db(db, crud.delete_subscription, subscription_id)
 
 #------
 # ADRESS ENDPOINTS
 #------
 
 @app.post("/adress", response_model=schemas.AdressRead, tags=["Adress"])
-def create_adress_endpoint(adress: schemas.AdressCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    return crud.create_adress(db, adress)
+async def create_adress_endpoint(adress: schemas.AdressCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    return await run_db(db, crud.create_adress, adress)
 
-@app.get("/adress/{adress_id}", response_model=schemas.AdressRead, tags=["Adress"])
-def get_adress_endpoint(adress_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    adress = crud.get_adress(db, adress_id)
+@app.get("/adress/{adress_id}", response_model=schemas.AdressRead, tags=["Adress"], dependencies=[conditional("Adress")])
+async def get_adress_endpoint(adress_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    adress = await run_db(db, crud.get_adress, adress_id)
     if not adress:
         raise HTTPException(status_code=404, detail="Endereço não encontrado")
     return adress
 
-@app.get("/adress/", response_model=List[schemas.AdressRead], tags=["Adress"])
-def get_all_adresses_endpoint(db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    adresses = crud.get_all_adresses(db)
-    return [schemas.AdressRead.model_validate(a) for a in adresses]
+@app.get("/adress/", response_model=List[schemas.AdressRead], tags=["Adress"], dependencies=[conditional("Adress")])
+async def get_all_adresses_endpoint(response: Response, page: PageParams = Depends(), city: str | None = None, neighborhood: str | None = None, id_client: int | None = None, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    adresses = await run_db(db, crud.get_all_adresses, limit=page.limit + 1, after=page.after, city=city, neighborhood=neighborhood, id_client=id_client)
+    return list_response(schemas.AdressRead, paginate(response, adresses, page.limit, "id_adress"), response)
 
-@app.get("/adress/client/{client_id}", response_model=List[schemas.AdressRead], tags=["Adress"])
-def get_adresses_by_client_endpoint(client_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    adresses = crud.get_adresses_by_client(db, client_id)
+@app.get("/adress/client/{client_id}", response_model=List[schemas.AdressRead], tags=["Adress"], dependencies=[conditional("Adress")])
+async def get_adresses_by_client_endpoint(client_id: int, response: Response, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    adresses = await run_db(db, crud.get_adresses_by_client, client_id)
     if not adresses:
         raise HTTPException(status_code=404, detail="Nenhum endereço encontrado para este cliente")
-    return [schemas.AdressRead.model_validate(a) for a in adresses]
+    return list_response(schemas.AdressRead, adresses, response)
+
+@app.post("/adress/by-clients", response_model=Dict[int, List[schemas.AdressRead]], tags=["Adress"])
+async def read_adresses_by_clients(batch: schemas.ClientIds, loaders: RequestLoaders = Depends(get_loaders), current_user: schemas.UsersRead = Depends(get_current_user)):
+    groups = await loaders.adresses.load_many(batch.ids)
+    return groups_response(schemas.AdressRead, dict(zip(batch.ids, groups)))
 
 @app.patch("/adress/{adress_id}", response_model=schemas.AdressRead, tags=["Adress"])
-def update_adress_endpoint(adress_id: int, adress_update: schemas.AdressCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    updated_adress = crud.update_adress(db, adress_id, adress_update)
+async def update_adress_endpoint(adress_id: int, adress_update: schemas.AdressCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    updated_adress = await run_db(db, crud.update_adress, adress_id, adress_update)
     if not updated_adress:
         raise HTTPException(status_code=404, detail="Endereço não encontrado")
     return updated_adress
 
 @app.delete("/adress/{adress_id}", tags=["Adress"])
-def delete_adress_endpoint(adress_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    if not crud.delete_adress(db, adress_id):
+async def delete_adress_endpoint(adress_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    if not await run_db(db, crud.delete_adress, adress_id):
         raise HTTPException(status_code=404, detail="Endereço não encontrado")
     return {"message": "Endereço deletado com sucesso"}
 
@@ -206,31 +344,163 @@ def delete_adress_endpoint(adress_id: int, db: Session = Depends(get_db), curren
 #------
 
 @app.post("/barber/", response_model=schemas.BarberRead, tags=["Barber"])
-def create_barber_endpoint(barber: schemas.BarberCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    return crud.create_barber(db, barber)
+async def create_barber_endpoint(barber: schemas.BarberCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    return await run_db(db, crud.create_barber, barber)
 
-@app.get("/barber/{barber_id}", response_model=schemas.BarberRead, tags=["Barber"])
-def get_barber_endpoint(barber_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    barber = crud.get_barber(db, barber_id)
+@app.get("/barber/{barber_id}", response_model=schemas.BarberRead, tags=["Barber"], dependencies=[conditional("Barber")])
+async def get_barber_endpoint(barber_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    barber = await run_db(db, crud.get_barber, barber_id)
     if not barber:
         raise HTTPException(status_code=404, detail="Barbeiro não encontrado")
     return barber
 
-@app.get("/barber/", response_model=List[schemas.BarberRead], tags=["Barber"])
-def get_all_barbers_endpoint(db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    barbers = crud.get_all_barbers(db)
-    return [schemas.BarberRead.model_validate(b) for b in barbers]
+@app.get("/barber/", response_model=List[schemas.BarberRead], tags=["Barber"], dependencies=[conditional("Barber")])
+async def get_all_barbers_endpoint(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    barbers = await run_db(db, crud.get_all_barbers, limit=page.limit + 1, after=page.after)
+    return list_response(schemas.BarberRead, paginate(response, barbers, page.limit, "id_barber"), response)
 
 @app.patch("/barber/{barber_id}", response_model=schemas.BarberRead, tags=["Barber"])
-def update_barber_endpoint(barber_id: int, barber_update: schemas.BarberCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    updated_barber = crud.update_barber(db, barber_id, barber_update)
+async def update_barber_endpoint(barber_id: int, barber_update: schemas.BarberCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    updated_barber = await run_db(db, crud.update_barber, barber_id, barber_update)
     if not updated_barber:
         raise HTTPException(status_code=404, detail="Barbeiro não encontrado")
     return updated_barber
 
 
 @app.delete("/barber/{barber_id}", tags=["Barber"])
-def delete_barber_endpoint(barber_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
-    if not crud.delete_barber(db, barber_id):
+async def delete_barber_endpoint(barber_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    if not await run_db(db, crud.delete_barber, barber_id):
         raise HTTPException(status_code=404, detail="Barbeiro não encontrado")
     return {"message": "Barbeiro deletado com sucesso"}
+
+#------
+# APPOINTMENT ENDPOINTS
+#------
+
+@app.post("/appointments/", response_model=schemas.AppointmentRead, tags=["Appointment"])
+async def create_appointment_endpoint(appointment: schemas.AppointmentCreate, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    return await run_db(db, crud.create_appointment, appointment)
+
+@app.get("/appointments/{appointment_id}", response_model=schemas.AppointmentRead, tags=["Appointment"], dependencies=[conditional("Appointments")])
+async def get_appointment_endpoint(appointment_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    appointment = await run_db(db, crud.get_appointment, appointment_id)
+    if not appointment:
+        raise HTTPException(status_code=404, detail="Agendamento não encontrado")
+    return appointment
+
+@app.get("/appointments/", response_model=List[schemas.AppointmentRead], tags=["Appointment"], dependencies=[conditional("Appointments")])
+async def get_all_appointments_endpoint(response: Response, page: PageParams = Depends(), id_barber: int | None = None, id_client: int | None = None, start: datetime | None = None, end: datetime | None = None, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    appointments = await run_db(db, crud.get_all_appointments, limit=page.limit + 1, after=page.after, id_barber=id_barber, id_client=id_client, start=start, end=end)
+    return list_response(schemas.AppointmentRead, paginate(response, appointments, page.limit, "id_appointment"), response)
+
+@app.delete("/appointments/{appointment_id}", tags=["Appointment"])
+async def delete_appointment_endpoint(appointment_id: int, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    if not await run_db(db, crud.delete_appointment, appointment_id):
+        raise HTTPException(status_code=404, detail="Agendamento não encontrado")
+    return {"message": "Agendamento cancelado com sucesso"}
+
+# Free slots for the given barbers (all barbers when none are given), date_to defaulting to a week
+@app.get("/availability", response_model=schemas.Availability, tags=["Appointment"], dependencies=[conditional("Appointments", "Barber")])
+async def read_availability(
+    response: Response,
+    date_from: date,
+    date_to: date | None = None,
+    barber_ids: List[int] | None = Query(None, max_length=schemas.BATCH_MAX_IDS),
+    duration: int = Query(APPOINTMENT_SLOT_MINUTES, ge=1, le=APPOINTMENT_MAX_MINUTES),
+    db: Session = Depends(get_db),
+    current_user: schemas.UsersRead = Depends(get_current_user),
+):
+    date_to = date_to or date_from + timedelta(days=6)
+    if date_to < date_from or (date_to - date_from).days >= AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"date_to must be within {AVAILABILITY_MAX_DAYS} days of date_from")
+    slots = await run_db(db, availability, barber_ids, date_from, date_to, duration, limit=schemas.BATCH_MAX_IDS)
+    return model_response(schemas.Availability, {"date_from": date_from, "date_to": date_to, "duration": duration, "slots": slots}, response)
+
+#------
+# REPORT ENDPOINTS
+#------
+
+def _report_range(date_from: date | None, date_to: date | None, default_days: int):
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=default_days)
+    if date_to < date_from or (date_to - date_from).days >= reporting.REPORT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"date_to must be within {reporting.REPORT_MAX_DAYS} days of date_from")
+    return date_from, date_to
+
+@app.get("/reports/subscriptions/payment-methods", response_model=List[schemas.PaymentMethodReport], tags=["Reports"], dependencies=[conditional("Subscriptions")])
+async def read_subscriptions_by_payment_method(response: Response, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    rows = await run_db(db, reporting.subscriptions_by_method)
+    return model_response(List[schemas.PaymentMethodReport], rows, response)
+
+# New vs. expiring subscriptions per month, the last twelve months by default
+@app.get("/reports/subscriptions/monthly", response_model=List[schemas.MonthlySubscriptionsReport], tags=["Reports"], dependencies=[conditional("Subscriptions", daily=True)])
+async def read_subscriptions_by_month(response: Response, date_from: date | None = None, date_to: date | None = None, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    date_from, date_to = _report_range(date_from, date_to, 334)
+    rows = await run_db(db, reporting.subscriptions_by_month, date_from, date_to)
+    return model_response(List[schemas.MonthlySubscriptionsReport], rows, response)
+
+# Subscriptions active on each day, the last 30 days by default
+@app.get("/reports/subscriptions/active", response_model=List[schemas.DailyActiveReport], tags=["Reports"], dependencies=[conditional("Subscriptions", daily=True)])
+async def read_active_by_day(response: Response, date_from: date | None = None, date_to: date | None = None, db: Session = Depends(get_db), current_user: schemas.UsersRead = Depends(get_current_user)):
+    date_from, date_to = _report_range(date_from, date_to, 29)
+    rows = await run_db(db, reporting.active_by_day, date_from, date_to)
+    return model_response(List[schemas.DailyActiveReport], rows, response)
+
+#------
+# EXPORT ENDPOINTS
+#------
+
+@app.get("/export/{resource}", tags=["Export"])
+async def export_endpoint(request: Request, resource: Literal["clients", "adress", "subscriptions"], format: Literal["ndjson", "csv"] = "ndjson", include_related: bool = False, current_user: schemas.UsersRead = Depends(get_current_user)):
+    if include_related and (resource != "clients" or format != "ndjson"):
+        raise HTTPException(status_code=400, detail="include_related is only available for clients exported as ndjson")
+    return StreamingResponse(
+        export_rows(resource, format, include_related, use_replica=reads_from_replica(request)),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{resource}.{format}"'},
+    )
+
+#------
+# STATS ENDPOINTS
+#------
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Stats"])
+async def read_metrics():
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/principal-cache", tags=["Stats"])
+async def read_principal_cache_stats(current_user: schemas.UsersRead = Depends(get_current_user)):
+    return principal_cache.stats()
+
+@app.get("/stats/client-cache", tags=["Stats"])
+async def read_client_cache_stats(current_user: schemas.UsersRead = Depends(get_current_user)):
+    return client_cache.stats()
+
+@app.get("/stats/password-hashing", tags=["Stats"])
+async def read_password_hashing_stats(current_user: schemas.UsersRead = Depends(get_current_user)):
+    return hash_pool.stats()
+
+@app.get("/stats/pool", tags=["Stats"])
+async def read_pool_stats(current_user: schemas.UsersRead = Depends(get_current_user)):
+    return pool_status(get_request_engine().pool, pool_wait_times)
+
+@app.get("/stats/replica", tags=["Stats"])
+async def read_replica_stats(current_user: schemas.UsersRead = Depends(get_current_user)):
+    return replica_health.stats()
+
+@app.get("/stats/sql-profile", tags=["Stats"])
+async def read_sql_profile(top: int = Query(SQL_PROFILE_TOP_N, ge=1, le=500), current_user: schemas.UsersRead = Depends(get_current_user)):
+    return sql_profile.report(top)
+
+@app.delete("/stats/sql-profile", tags=["Stats"])
+async def reset_sql_profile(current_user: schemas.UsersRead = Depends(get_current_user)):
+    sql_profile.reset()
+    return {"message": "SQL profile reset"}
+
+# Writes the report to SQL_PROFILE_DUMP_PATH on the server; the path is never taken from the request
+@app.post("/stats/sql-profile/dump", tags=["Stats"])
+async def dump_sql_profile(top: int = Query(SQL_PROFILE_TOP_N, ge=1, le=500), current_user: schemas.UsersRead = Depends(get_current_user)):
+    if not SQL_PROFILE_DUMP_PATH:
+        raise HTTPException(status_code=409, detail="SQL_PROFILE_DUMP_PATH is not configured")
+    path = await run_in_threadpool(profiler.dump, SQL_PROFILE_DUMP_PATH, top)
+    return {"path": path}
@@ -0,0 +1,206 @@
+import contextvars
+import threading
+import time
+from collections import deque
+
+# Keeps the most recent `maxlen` samples so percentiles follow current traffic
+class LatencyWindow:
+    def __init__(self, maxlen: int = 2048):
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def percentiles(self, *quantiles: float):
+        with self._lock:
+            samples = sorted(self._samples)
+        return _percentiles(samples, quantiles)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            result = {"count": self.count, "total_seconds": self.total}
+        result.update(_percentiles(samples, (0.5, 0.95, 0.99)))
+        result["max"] = samples[-1] if samples else 0.0
+        return result
+
+def _percentiles(samples, quantiles):
+    if not samples:
+        return {f"p{int(q * 100)}": 0.0 for q in quantiles}
+    last = len(samples) - 1
+    return {f"p{int(q * 100)}": samples[min(last, int(round(q * last)))] for q in quantiles}
+
+#------
+#POOL METRICS
+#------
+
+def pool_status(pool, wait_times: LatencyWindow | None = None):
+    status = {"pool_class": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    if wait_times is not None:
+        status["checkout_wait_seconds"] = wait_times.summary()
+    return status
+
+#------
+#REQUEST METRICS
+#------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# Per-request DB accounting, filled in by the engine hooks while the request runs
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+current_request_stats = contextvars.ContextVar("current_request_stats", default=None)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self, name: str, label_names: tuple):
+        lines = []
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = _labels(label_names, labels)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{base}}} {total}")
+            lines.append(f"{name}_count{{{base}}} {count}")
+        return lines
+
+def _labels(names: tuple, values: tuple):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+class RequestMetrics:
+    def __init__(self):
+        self.requests = {}
+        self.db_queries = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.query_counts = Histogram(QUERY_COUNT_BUCKETS)
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            key = (method, route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            labels = (method, route)
+            self.db_queries[labels] = self.db_queries.get(labels, 0) + stats.queries
+            self.latency.observe(labels, seconds)
+            self.db_time.observe(labels, stats.db_seconds)
+            self.query_counts.observe(labels, stats.queries)
+
+    def render(self):
+        route_labels = ("method", "route")
+        with self._lock:
+            lines = [
+                "# HELP http_requests_total Requests handled, by route template and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            lines += [f"http_requests_total{{{_labels(('method', 'route', 'status'), key)}}} {n}" for key, n in sorted(self.requests.items())]
+            lines += [
+                "# HELP http_request_duration_seconds Time from request start to the last body byte.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            lines += self.latency.render("http_request_duration_seconds", route_labels)
+            lines += [
+                "# HELP http_request_db_seconds Time spent executing SQL per request.",
+                "# TYPE http_request_db_seconds histogram",
+            ]
+            lines += self.db_time.render("http_request_db_seconds", route_labels)
+            lines += [
+                "# HELP http_request_db_queries SQL statements executed per request.",
+                "# TYPE http_request_db_queries histogram",
+            ]
+            lines += self.query_counts.render("http_request_db_queries", route_labels)
+            lines += [
+                "# HELP http_request_db_queries_total SQL statements executed, by route template.",
+                "# TYPE http_request_db_queries_total counter",
+            ]
+            lines += [f"http_request_db_queries_total{{{_labels(route_labels, key)}}} {n}" for key, n in sorted(self.db_queries.items())]
+        return "\n".join(lines) + "\n"
+
+request_metrics = RequestMetrics()
+
+# Pure ASGI middleware: labels by the matched route template (scope["route"]), never the raw path
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_stats.reset(token)
+            route = scope.get("route")
+            request_metrics.record(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - started,
+                stats,
+            )
+
+# The start time lives on the execution context, which is dropped with the statement, so a
+# statement that raises (and never reaches after_cursor_execute) leaves nothing behind
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started_at = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = context._query_started_at
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,291 @@
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, inspect, select, text
+import models, reporting, schemas
+from database import get_engine
+
+# Versioned schema changes, applied in order by `python migrations.py`.
+# Each migration runs in its own transaction and is recorded in schema_migrations.
+# The app never creates tables on import; run this on deploy, or set DB_AUTO_MIGRATE
+# to have each worker apply pending migrations from its startup hook.
+#
+# Concurrent runs (several workers starting at once) are serialized: on Postgres by an
+# advisory lock held for the whole run, on SQLite by taking the write lock (BEGIN
+# IMMEDIATE) at the start of each migration's transaction. Either way the version is
+# re-read inside that transaction, so a migration another process already applied is
+# skipped. Other dialects get no lock; there, run migrations from a single process.
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100)),
+    Column("applied_at", DateTime),
+)
+
+BACKFILL_CHUNK_SIZE = 5000
+# Arbitrary key of the Postgres advisory lock, and how long SQLite waits for the write lock
+MIGRATION_LOCK_KEY = 7_031_202_601
+MIGRATION_LOCK_TIMEOUT = 600
+
+# The five tables as they stood before the first migration, frozen here rather than read
+# from models so that a fresh install goes through 0002 onwards like an existing database.
+# checkfirst leaves databases created by the old create_all at startup untouched.
+baseline_metadata = MetaData()
+Table(
+    "Users", baseline_metadata,
+    Column("id_user", Integer, primary_key=True, index=True),
+    Column("login", String(30), unique=True, index=True),
+    Column("hashed_password", String(60)),
+    Column("position", String(45)),
+)
+Table(
+    "Clients", baseline_metadata,
+    Column("id_client", Integer, primary_key=True, index=True),
+    Column("cpf", String(11)),
+    Column("name", String(60)),
+    Column("phone", String(12)),
+)
+Table(
+    "Subscriptions", baseline_metadata,
+    Column("id_subscription", Integer, primary_key=True, index=True),
+    Column("start_date", Date),
+    Column("duration", Integer),
+    Column("payment_method", String(45)),
+    Column("end_date", Date),
+    Column("id_client", Integer, index=True),
+)
+Table(
+    "Adress", baseline_metadata,
+    Column("id_adress", Integer, primary_key=True, index=True),
+    Column("logradouro", String(45)),
+    Column("number", String(45)),
+    Column("neighborhood", String(45)),
+    Column("city", String(45)),
+    Column("complement", String(45)),
+    Column("id_client", Integer, index=True),
+)
+Table(
+    "Barber", baseline_metadata,
+    Column("id_barber", Integer, primary_key=True, index=True),
+    Column("name", String(100)),
+)
+
+def _0001_baseline(conn):
+    baseline_metadata.create_all(bind=conn)
+
+# Normalizes every CPF to digits only, merges clients that collapse onto the same
+# CPF into the oldest row (re-pointing their addresses and subscriptions), then
+# adds the unique index used by register_client's ON CONFLICT
+def _0002_unique_client_cpf(conn):
+    clients = models.Clients.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(clients.c.id_client, clients.c.cpf)
+            .where(clients.c.id_client > last_id)
+            .order_by(clients.c.id_client)
+            .limit(BACKFILL_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id_client
+        changed = [
+            {"id": row.id_client, "cpf": schemas.normalize_cpf(row.cpf)}
+            for row in rows
+            if row.cpf is not None and schemas.normalize_cpf(row.cpf) != row.cpf
+        ]
+        if changed:
+            conn.execute(text('UPDATE "Clients" SET cpf = :cpf WHERE id_client = :id'), changed)
+
+    duplicates = conn.execute(text(
+        'SELECT c.id_client, k.keep_id FROM "Clients" c '
+        'JOIN (SELECT cpf, MIN(id_client) AS keep_id FROM "Clients" GROUP BY cpf HAVING COUNT(*) > 1) k '
+        'ON c.cpf = k.cpf AND c.id_client <> k.keep_id'
+    )).all()
+    if duplicates:
+        params = [{"old": row.id_client, "keep": row.keep_id} for row in duplicates]
+        conn.execute(text('UPDATE "Adress" SET id_client = :keep WHERE id_client = :old'), params)
+        conn.execute(text('UPDATE "Subscriptions" SET id_client = :keep WHERE id_client = :old'), params)
+        conn.execute(text('DELETE FROM "Clients" WHERE id_client = :old'), [{"old": row.id_client} for row in duplicates])
+
+    indexes = {index["name"]: index for index in inspect(conn).get_indexes("Clients")}
+    if "ix_Clients_cpf" in indexes and not indexes["ix_Clients_cpf"]["unique"]:
+        conn.execute(text('DROP INDEX "ix_Clients_cpf"'))
+        indexes.pop("ix_Clients_cpf")
+    if "ix_Clients_cpf" not in indexes:
+        conn.execute(text('CREATE UNIQUE INDEX "ix_Clients_cpf" ON "Clients" (cpf)'))
+
+# Adds Clients.name_search (lowercased, accent-free name) and the index behind /clients/search
+def _0003_client_name_search(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("Clients")}
+    if "name_search" not in columns:
+        conn.execute(text('ALTER TABLE "Clients" ADD COLUMN name_search VARCHAR(60)'))
+    clients = models.Clients.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(clients.c.id_client, clients.c.name)
+            .where(clients.c.id_client > last_id, clients.c.name_search.is_(None))
+            .order_by(clients.c.id_client)
+            .limit(BACKFILL_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id_client
+        conn.execute(
+            text('UPDATE "Clients" SET name_search = :key WHERE id_client = :id'),
+            [{"id": row.id_client, "key": models.search_key(row.name) or ""} for row in rows],
+        )
+    if "ix_Clients_name_search" not in {index["name"] for index in inspect(conn).get_indexes("Clients")}:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text('CREATE INDEX "ix_Clients_name_search" ON "Clients" USING gin (name_search gin_trgm_ops)'))
+        else:
+            conn.execute(text('CREATE INDEX "ix_Clients_name_search" ON "Clients" (name_search)'))
+
+def _0004_subscription_date_indexes(conn):
+    existing = {index["name"] for index in inspect(conn).get_indexes("Subscriptions")}
+    if "ix_Subscriptions_end_date_id_client" not in existing:
+        conn.execute(text('CREATE INDEX "ix_Subscriptions_end_date_id_client" ON "Subscriptions" (end_date, id_client)'))
+    if "ix_Subscriptions_id_client_end_date" not in existing:
+        conn.execute(text('CREATE INDEX "ix_Subscriptions_id_client_end_date" ON "Subscriptions" (id_client, end_date)'))
+
+# Foreign keys from Adress and Subscriptions to Clients. On Postgres they are added NOT VALID,
+# so existing orphan rows do not block the migration while new writes are still checked.
+# SQLite cannot add constraints to existing tables; there the ORM relationships alone apply.
+def _0005_client_foreign_keys(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    for table in ("Adress", "Subscriptions"):
+        existing = {fk["name"] for fk in inspect(conn).get_foreign_keys(table)}
+        name = f"fk_{table}_id_client_Clients"
+        if name not in existing:
+            conn.execute(text(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" '
+                'FOREIGN KEY (id_client) REFERENCES "Clients" (id_client) NOT VALID'
+            ))
+
+# Per-table version counters behind the ETags of the GET endpoints
+def _0006_table_versions(conn):
+    table = models.TableVersions.__table__
+    table.create(bind=conn, checkfirst=True)
+    existing = set(conn.execute(select(table.c.name)).scalars())
+    missing = [row for row in models.initial_versions() if row["name"] not in existing]
+    if missing:
+        conn.execute(table.insert(), missing)
+
+def _0007_archive_tables(conn):
+    for archive in models.ARCHIVES.values():
+        archive.__table__.create(bind=conn, checkfirst=True)
+
+# Appointments table, its table_versions row, and on Postgres the constraint that makes
+# double booking impossible even for writers racing past the booking query's overlap check
+def _0008_appointments(conn):
+    models.Appointments.__table__.create(bind=conn, checkfirst=True)
+    versions = models.TableVersions.__table__
+    existing = set(conn.execute(select(versions.c.name)).scalars())
+    missing = [row for row in models.initial_versions() if row["name"] not in existing]
+    if missing:
+        conn.execute(versions.insert(), missing)
+    if conn.dialect.name != "postgresql":
+        return
+    constraints = conn.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE conname = 'ex_Appointments_barber_overlap'"
+    )).first()
+    if constraints is None:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+        conn.execute(text(
+            'ALTER TABLE "Appointments" ADD CONSTRAINT "ex_Appointments_barber_overlap" '
+            "EXCLUDE USING gist (id_barber WITH =, tsrange(start_at, end_at) WITH &&)"
+        ))
+
+def _0009_subscription_reports(conn):
+    models.SubscriptionDailyStats.__table__.create(bind=conn, checkfirst=True)
+    models.SubscriptionMethodStats.__table__.create(bind=conn, checkfirst=True)
+    reporting.rebuild(conn)
+
+def _0010_subscription_renewals(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("Subscriptions")}
+    if "auto_renew" not in columns:
+        conn.execute(text('ALTER TABLE "Subscriptions" ADD COLUMN auto_renew BOOLEAN NOT NULL DEFAULT false'))
+    if "status" not in columns:
+        conn.execute(text("ALTER TABLE \"Subscriptions\" ADD COLUMN status VARCHAR(10) NOT NULL DEFAULT 'active'"))
+    models.BatchJobRuns.__table__.create(bind=conn, checkfirst=True)
+
+def _0011_appointments_archive(conn):
+    models.AppointmentsArchive.__table__.create(bind=conn, checkfirst=True)
+
+# The keyset filter indexes on Adress predate the migration series and were only ever
+# created by the old models-based baseline
+def _0012_adress_filter_indexes(conn):
+    existing = {index["name"] for index in inspect(conn).get_indexes("Adress")}
+    if "ix_Adress_city_id_adress" not in existing:
+        conn.execute(text('CREATE INDEX "ix_Adress_city_id_adress" ON "Adress" (city, id_adress)'))
+    if "ix_Adress_neighborhood_id_adress" not in existing:
+        conn.execute(text('CREATE INDEX "ix_Adress_neighborhood_id_adress" ON "Adress" (neighborhood, id_adress)'))
+
+MIGRATIONS = [
+    (1, "baseline", _0001_baseline),
+    (2, "unique_client_cpf", _0002_unique_client_cpf),
+    (3, "client_name_search", _0003_client_name_search),
+    (4, "subscription_date_indexes", _0004_subscription_date_indexes),
+    (5, "client_foreign_keys", _0005_client_foreign_keys),
+    (6, "table_versions", _0006_table_versions),
+    (7, "archive_tables", _0007_archive_tables),
+    (8, "appointments", _0008_appointments),
+    (9, "subscription_reports", _0009_subscription_reports),
+    (10, "subscription_renewals", _0010_subscription_renewals),
+    (11, "appointments_archive", _0011_appointments_archive),
+    (12, "adress_filter_indexes", _0012_adress_filter_indexes),
+]
+
+def current_version(conn):
+    migration_metadata.create_all(bind=conn)
+    return conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar() or 0
+
+@contextmanager
+def _run_lock(bind):
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+# pysqlite only opens a transaction before DML, so the write lock is taken explicitly; the
+# busy timeout is raised while waiting for another process's migration and then restored
+@contextmanager
+def _migration_transaction(bind):
+    with bind.begin() as conn:
+        if conn.dialect.name != "sqlite":
+            yield conn
+            return
+        busy_timeout = conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+        conn.exec_driver_sql(f"PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT * 1000}")
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        finally:
+            conn.exec_driver_sql(f"PRAGMA busy_timeout = {busy_timeout}")
+        yield conn
+
+def upgrade(bind=None):
+    bind = bind or get_engine()
+    applied = []
+    with _run_lock(bind):
+        for number, name, migrate in MIGRATIONS:
+            with _migration_transaction(bind) as conn:
+                if number <= current_version(conn):
+                    continue
+                migrate(conn)
+                conn.execute(schema_migrations.insert().values(version=number, name=name, applied_at=datetime.utcnow()))
+            applied.append(f"{number:04d}_{name}")
+    return applied
+
+if __name__ == "__main__":
+    for migration in upgrade():
+        print(f"applied {migration}")
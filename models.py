@@ -1,6 +1,20 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
+import time
+import unicodedata
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, Date, DateTime, ForeignKey, Index, UniqueConstraint, DDL, event, false
+from sqlalchemy.orm import relationship, validates
 from database import Base
 
+# Lowercased, accent-free, single-spaced form of a name, used by client search
+def search_key(name: str | None):
+    if name is None:
+        return None
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.lower().split())
+
+def _name_search_default(context):
+    return search_key(context.get_current_parameters().get("name"))
+
 class Users(Base):
     __tablename__ = "Users"
     id_user = Column(Integer, primary_key=True, index=True)
@@ -11,9 +25,34 @@ class Users(Base):
 class Clients(Base):
     __tablename__ = "Clients"
     id_client = Column(Integer, primary_key=True, index=True)
-    cpf = Column(String(11))
+    cpf = Column(String(11), unique=True, index=True)
     name = Column(String(60))
     phone = Column(String(12))
+    name_search = Column(String(60), default=_name_search_default)
+
+    adresses = relationship("Adress", back_populates="client")
+    subscriptions = relationship("Subscriptions", back_populates="client")
+
+    # Trigram GIN on Postgres (prefix LIKE and similarity); a plain b-tree elsewhere
+    __table_args__ = (
+        Index(
+            "ix_Clients_name_search",
+            "name_search",
+            postgresql_using="gin",
+            postgresql_ops={"name_search": "gin_trgm_ops"},
+        ),
+    )
+
+    @validates("name")
+    def _sync_name_search(self, key, name):
+        self.name_search = search_key(name)
+        return name
+
+event.listen(
+    Clients.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
 
 class Subscriptions(Base):
     __tablename__ = "Subscriptions"
@@ -22,7 +61,19 @@ class Subscriptions(Base):
     duration = Column(Integer)
     payment_method = Column(String(45))
     end_date = Column(Date) 
-    id_client = Column(Integer, index=True)
+    id_client = Column(Integer, ForeignKey("Clients.id_client"), index=True)
+    # Set by the renewal job (renewals.py): lapsed auto_renew subscriptions are extended by
+    # `duration` days, the others are marked "expired"
+    auto_renew = Column(Boolean, nullable=False, default=False, server_default=false())
+    status = Column(String(10), nullable=False, default="active", server_default="active")
+
+    client = relationship("Clients", back_populates="subscriptions")
+
+    # Date-range reads: active/expiring/expired scans by end_date, and the per-client current subscription
+    __table_args__ = (
+        Index("ix_Subscriptions_end_date_id_client", "end_date", "id_client"),
+        Index("ix_Subscriptions_id_client_end_date", "id_client", "end_date"),
+    )
     
 class Adress(Base):
     __tablename__ = "Adress"
@@ -32,13 +83,137 @@ class Adress(Base):
     neighborhood = Column(String(45))
     city = Column(String(45))
     complement = Column(String(45)) 
-    id_client = Column(Integer, index=True)
+    id_client = Column(Integer, ForeignKey("Clients.id_client"), index=True)
+
+    client = relationship("Clients", back_populates="adresses")
+
+    # Filtered keyset pages: "WHERE city = ? AND id_adress > ? ORDER BY id_adress"
+    __table_args__ = (
+        Index("ix_Adress_city_id_adress", "city", "id_adress"),
+        Index("ix_Adress_neighborhood_id_adress", "neighborhood", "id_adress"),
+    )
     
 class Barber(Base):
     __tablename__ = "Barber"
     id_barber = Column(Integer, primary_key=True, index=True)
     name = Column(String(100))
-    
+
+# Half-open [start_at, end_at) bookings. (id_barber, start_at) turns the overlap test of the
+# availability and booking queries into a bounded range scan per barber (an appointment is
+# never longer than APPOINTMENT_MAX_MINUTES); on Postgres an exclusion constraint added by
+# migrations.py also rejects overlapping rows outright.
+class Appointments(Base):
+    __tablename__ = "Appointments"
+    id_appointment = Column(Integer, primary_key=True, index=True)
+    id_barber = Column(Integer, ForeignKey("Barber.id_barber"), nullable=False)
+    id_client = Column(Integer, ForeignKey("Clients.id_client"), nullable=False)
+    start_at = Column(DateTime, nullable=False)
+    end_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_Appointments_id_barber_start_at", "id_barber", "start_at"),
+        Index("ix_Appointments_id_client_start_at", "id_client", "start_at"),
+    )
+
+# Summary tables behind the subscription reports, maintained by reporting.record() from the
+# subscription write paths and recomputed by `python reporting.py --rebuild`
+class SubscriptionDailyStats(Base):
+    __tablename__ = "SubscriptionDailyStats"
+    day = Column(Date, primary_key=True)
+    started = Column(Integer, nullable=False, default=0)
+    ending = Column(Integer, nullable=False, default=0)
+
+class SubscriptionMethodStats(Base):
+    __tablename__ = "SubscriptionMethodStats"
+    payment_method = Column(String(45), primary_key=True)
+    subscriptions = Column(Integer, nullable=False, default=0)
+
+# Checkpoint of a chunked batch job: one row per job and as-of date, advanced in the same
+# transaction as each chunk, so an interrupted run resumes after the last committed chunk
+class BatchJobRuns(Base):
+    __tablename__ = "BatchJobRuns"
+    id_run = Column(Integer, primary_key=True)
+    job = Column(String(45), nullable=False)
+    as_of = Column(Date, nullable=False)
+    last_id = Column(Integer, nullable=False, default=0)
+    processed = Column(BigInteger, nullable=False, default=0)
+    renewed = Column(BigInteger, nullable=False, default=0)
+    expired = Column(BigInteger, nullable=False, default=0)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (UniqueConstraint("job", "as_of", name="uq_BatchJobRuns_job_as_of"),)
+
+# Rows moved out of the live tables by an archiving client removal or by orphan compaction.
+# The original ids are kept as plain columns (SQLite reuses freed ids, so the same id can be
+# archived twice); no foreign keys, an archived row outlives its client.
+class ClientsArchive(Base):
+    __tablename__ = "ClientsArchive"
+    id_archive = Column(Integer, primary_key=True)
+    id_client = Column(Integer, index=True)
+    cpf = Column(String(11), index=True)
+    name = Column(String(60))
+    phone = Column(String(12))
+    archived_at = Column(DateTime, nullable=False)
+
+class SubscriptionsArchive(Base):
+    __tablename__ = "SubscriptionsArchive"
+    id_archive = Column(Integer, primary_key=True)
+    id_subscription = Column(Integer)
+    start_date = Column(Date)
+    duration = Column(Integer)
+    payment_method = Column(String(45))
+    end_date = Column(Date)
+    id_client = Column(Integer, index=True)
+    archived_at = Column(DateTime, nullable=False)
+
+class AdressArchive(Base):
+    __tablename__ = "AdressArchive"
+    id_archive = Column(Integer, primary_key=True)
+    id_adress = Column(Integer)
+    logradouro = Column(String(45))
+    number = Column(String(45))
+    neighborhood = Column(String(45))
+    city = Column(String(45))
+    complement = Column(String(45))
+    id_client = Column(Integer, index=True)
+    archived_at = Column(DateTime, nullable=False)
+
+class AppointmentsArchive(Base):
+    __tablename__ = "AppointmentsArchive"
+    id_archive = Column(Integer, primary_key=True)
+    id_appointment = Column(Integer)
+    id_barber = Column(Integer)
+    id_client = Column(Integer, index=True)
+    start_at = Column(DateTime)
+    end_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+ARCHIVES = {
+    Clients: ClientsArchive,
+    Subscriptions: SubscriptionsArchive,
+    Adress: AdressArchive,
+    Appointments: AppointmentsArchive,
+}
+
+# One row per versioned table, bumped by every crud write in the same transaction; GET
+# endpoints build their ETag from it
+class TableVersions(Base):
+    __tablename__ = "table_versions"
+    name = Column(String(45), primary_key=True)
+    version = Column(BigInteger, nullable=False)
+
+VERSIONED_TABLES = ("Clients", "Subscriptions", "Adress", "Barber", "Appointments")
+
+# Seeded from the clock so a recreated database never hands out an ETag it used before
+def initial_versions():
+    version = time.time_ns() // 1000
+    return [{"name": name, "version": version} for name in VERSIONED_TABLES]
+
+@event.listens_for(TableVersions.__table__, "after_create")
+def _seed_table_versions(target, connection, **kw):
+    connection.execute(target.insert(), initial_versions())
+
 # class users_clients(Base):
 #     __tablename__ = "users_clients"
 #     id_user = Column(Integer, ForeignKey("Users.id_user"), primary_key=True)
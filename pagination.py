@@ -0,0 +1,34 @@
+import base64
+from fastapi import HTTPException, Query, Response
+import config
+
+PAGE_SIZE_DEFAULT = getattr(config, "PAGE_SIZE_DEFAULT", 100)
+PAGE_SIZE_MAX = getattr(config, "PAGE_SIZE_MAX", 1000)
+
+# Cursors are opaque to clients; they carry the last primary key of the previous page
+def encode_cursor(last_id: int):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str | None):
+    if cursor is None:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+        after: str | None = Query(None),
+    ):
+        self.limit = limit
+        self.after = decode_cursor(after)
+
+# Rows must be fetched with limit + 1 so the extra row tells us whether another page exists
+def paginate(response: Response, rows: list, limit: int, key: str):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(getattr(rows[-1], key))
+    return rows
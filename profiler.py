@@ -0,0 +1,288 @@
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+import config
+
+# Opt-in SQL profiler (SQL_PROFILE = True in config). Every statement run on the app's engines
+# is timed and attributed to the route that issued it, then aggregated under its normalized
+# text (literals, placeholders and IN lists collapsed) into the top-N tables served by
+# GET /stats/sql-profile. The first execution of a statement slower than SQL_PROFILE_SLOW_MS
+# gets its plan captured (EXPLAIN, or EXPLAIN QUERY PLAN on SQLite) with full table scans
+# flagged, and a request that runs the same SELECT SQL_PROFILE_N_PLUS_ONE times or more is
+# recorded as an N+1 suspect. Each statement is logged at DEBUG on the "sql_profile" logger,
+# slow ones and N+1 suspects at WARNING. Normalized text only, so no parameter values end up
+# in logs or dumps.
+
+SQL_PROFILE = getattr(config, "SQL_PROFILE", False)
+SQL_PROFILE_SLOW_MS = getattr(config, "SQL_PROFILE_SLOW_MS", 100)
+SQL_PROFILE_N_PLUS_ONE = getattr(config, "SQL_PROFILE_N_PLUS_ONE", 5)
+SQL_PROFILE_TOP_N = getattr(config, "SQL_PROFILE_TOP_N", 20)
+# Distinct normalized statements kept; later ones are counted under OTHER_STATEMENTS
+SQL_PROFILE_MAX_STATEMENTS = getattr(config, "SQL_PROFILE_MAX_STATEMENTS", 2000)
+# Written at shutdown and by POST /stats/sql-profile/dump; None disables dumping
+SQL_PROFILE_DUMP_PATH = getattr(config, "SQL_PROFILE_DUMP_PATH", None)
+
+OTHER_STATEMENTS = "(other statements)"
+NO_ROUTE = "(no request)"
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+logger = logging.getLogger("sql_profile")
+
+#------
+#NORMALIZATION
+#------
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<!:):\w+")
+_IN_LIST = re.compile(r"\bIN \(\?(?:, \?)*\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+")
+_SPACE = re.compile(r"\s+")
+
+# One key per statement shape: `id IN (?, ?, ?)` and `id IN (?)` count as the same query
+@lru_cache(maxsize=4096)
+def normalize(statement: str):
+    text = _SPACE.sub(" ", statement).strip()
+    text = _STRING.sub("?", text)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _IN_LIST.sub("IN (...)", text)
+    return _VALUES_ROWS.sub(r"\1, ...", text)
+
+#------
+#PLANS
+#------
+
+_FULL_SCAN = re.compile(r"^\s*SCAN (?!CONSTANT ROW)(?!.*\bINDEX\b)|\bSeq Scan on\b|\btype=ALL\b")
+
+def _plan_lines(dialect: str, cursor):
+    rows = cursor.fetchall()
+    if dialect == "sqlite":
+        # (id, parent, notused, detail) rows; indent each step under its parent
+        depth = {0: -1}
+        lines = []
+        for id_, parent, _, detail in rows:
+            depth[id_] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[id_] + detail)
+        return lines
+    if cursor.description and len(cursor.description) > 1:
+        names = [column[0] for column in cursor.description]
+        return [" ".join(f"{name}={value}" for name, value in zip(names, row) if value is not None) for row in rows]
+    return [str(row[0]) for row in rows]
+
+# Runs the plan on a raw DBAPI cursor of the same connection, so it sees the same transaction
+# and is not itself counted by the engine hooks. On Postgres a failed EXPLAIN would abort the
+# request's transaction, hence the savepoint around it.
+def explain(conn, statement: str, parameters):
+    dialect = conn.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    savepoint = dialect == "postgresql"
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT sql_profile_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            lines = _plan_lines(dialect, cursor)
+        except Exception as error:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT sql_profile_explain")
+            return {"error": f"{type(error).__name__}: {error}"[:200]}
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT sql_profile_explain")
+    finally:
+        cursor.close()
+    return {"lines": lines, "full_scan": any(_FULL_SCAN.search(line) for line in lines)}
+
+#------
+#AGGREGATION
+#------
+
+class StatementStats:
+    __slots__ = ("statement", "count", "total_seconds", "max_seconds", "slow", "routes", "plan", "plan_seconds")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.slow = 0
+        self.routes = Counter()
+        self.plan = None
+        self.plan_seconds = None
+
+    def as_dict(self):
+        entry = {
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total_seconds * 1000, 3),
+            "mean_ms": round(self.total_seconds * 1000 / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "slow": self.slow,
+            "routes": dict(self.routes.most_common(5)),
+        }
+        if self.plan is not None:
+            entry["plan"] = self.plan
+            entry["plan_captured_at_ms"] = round(self.plan_seconds * 1000, 3)
+        return entry
+
+class SqlProfile:
+    def __init__(self, slow_seconds: float, n_plus_one: int, max_statements: int):
+        self.slow_seconds = slow_seconds
+        self.n_plus_one = n_plus_one
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.since = datetime.now()
+            self.statements = {}
+            self.executions = 0
+            self.total_seconds = 0.0
+            self.suspects = {}
+
+    # Returns True when this execution should have its plan captured
+    def observe(self, statement: str, route: str, seconds: float):
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            self.executions += 1
+            self.total_seconds += seconds
+            stats = self.statements.get(statement)
+            if stats is None:
+                if len(self.statements) >= self.max_statements:
+                    statement = OTHER_STATEMENTS
+                stats = self.statements.get(statement)
+                if stats is None:
+                    stats = self.statements[statement] = StatementStats(statement)
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.routes[route] += 1
+            if not slow:
+                return False
+            stats.slow += 1
+            return stats.plan is None and statement != OTHER_STATEMENTS
+
+    def set_plan(self, statement: str, plan: dict, seconds: float):
+        with self._lock:
+            stats = self.statements.get(statement)
+            if stats is not None and stats.plan is None:
+                stats.plan = plan
+                stats.plan_seconds = seconds
+
+    def record_request(self, route: str, statements: Counter):
+        suspects = [(statement, n) for statement, n in statements.items() if n >= self.n_plus_one]
+        if not suspects:
+            return
+        with self._lock:
+            for statement, n in suspects:
+                entry = self.suspects.get((route, statement))
+                if entry is None:
+                    entry = self.suspects[(route, statement)] = {"route": route, "statement": statement, "requests": 0, "max_repeats": 0, "total_repeats": 0}
+                entry["requests"] += 1
+                entry["max_repeats"] = max(entry["max_repeats"], n)
+                entry["total_repeats"] += n
+        for statement, n in suspects:
+            logger.warning("possible N+1: %s ran %d times in one request: %s", route, n, statement)
+
+    def report(self, top: int = SQL_PROFILE_TOP_N):
+        with self._lock:
+            statements = [stats.as_dict() for stats in self.statements.values()]
+            suspects = [dict(entry) for entry in self.suspects.values()]
+            summary = {
+                "enabled": SQL_PROFILE,
+                "since": self.since.isoformat(),
+                "executions": self.executions,
+                "total_ms": round(self.total_seconds * 1000, 3),
+                "distinct_statements": len(self.statements),
+                "slow_threshold_ms": round(self.slow_seconds * 1000, 3),
+                "n_plus_one_threshold": self.n_plus_one,
+            }
+        planned = [entry for entry in statements if "plan" in entry]
+        summary.update(
+            top_by_total_time=sorted(statements, key=lambda entry: entry["total_ms"], reverse=True)[:top],
+            top_by_count=sorted(statements, key=lambda entry: entry["count"], reverse=True)[:top],
+            top_by_max_time=sorted(statements, key=lambda entry: entry["max_ms"], reverse=True)[:top],
+            full_scans=sorted(
+                (entry for entry in planned if entry["plan"].get("full_scan")),
+                key=lambda entry: entry["total_ms"], reverse=True,
+            )[:top],
+            slow_plans=sorted(planned, key=lambda entry: entry["max_ms"], reverse=True)[:top],
+            n_plus_one=sorted(suspects, key=lambda entry: (entry["requests"], entry["max_repeats"]), reverse=True)[:top],
+        )
+        return summary
+
+sql_profile = SqlProfile(SQL_PROFILE_SLOW_MS / 1000, SQL_PROFILE_N_PLUS_ONE, SQL_PROFILE_MAX_STATEMENTS)
+
+def dump(path: str, top: int = SQL_PROFILE_TOP_N):
+    with open(path, "w") as f:
+        json.dump(sql_profile.report(top), f, indent=2, default=str)
+    return path
+
+#------
+#REQUEST ATTRIBUTION
+#------
+
+# The statements one request ran; the route is read from the scope when a statement runs,
+# since the router fills scope["route"] only after the middleware has started
+class RequestProfile:
+    __slots__ = ("scope", "statements")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.statements = Counter()
+
+    def route(self):
+        route = self.scope.get("route")
+        return f"{self.scope['method']} {getattr(route, 'path', 'unmatched')}"
+
+current_request_profile = contextvars.ContextVar("current_request_profile", default=None)
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = RequestProfile(scope)
+        token = current_request_profile.set(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_request_profile.reset(token)
+            sql_profile.record_request(profile.route(), profile.statements)
+
+#------
+#ENGINE HOOKS
+#------
+
+# Timed on the execution context like metrics, so failed statements leave nothing on the connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profile_started_at = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context._profile_started_at
+    normalized = normalize(statement)
+    request = current_request_profile.get()
+    route = request.route() if request is not None else NO_ROUTE
+    if request is not None and normalized.startswith(("SELECT", "WITH")):
+        request.statements[normalized] += 1
+    logger.debug("%.2f ms %s %s", seconds * 1000, route, normalized)
+    if not sql_profile.observe(normalized, route, seconds):
+        return
+    logger.warning("slow statement: %.2f ms %s %s", seconds * 1000, route, normalized)
+    if not executemany and normalized.upper().startswith(EXPLAINABLE):
+        sql_profile.set_plan(normalized, explain(conn, statement, parameters), seconds)
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,146 @@
+import argparse
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from sqlalchemy import String, func, literal, select, update
+from sqlalchemy.orm import Session
+import config, models, reporting
+from crud import bump_versions
+from database import SessionLocal, init_engine
+
+# Processes every subscription that lapsed before an as-of date. Meant to run daily from cron:
+#
+#   python renewals.py --as-of 2026-10-18
+#
+# Lapsed subscriptions (status "active", end_date < as_of) with auto_renew get end_date
+# pushed forward by `duration` days, one period per run; the rest are marked "expired",
+# including auto_renew ones without a positive duration, which cannot be renewed.
+# The table is walked in primary-key windows of RENEWAL_CHUNK_SIZE ids, each window handled
+# by two set-based UPDATEs in its own short transaction, so row locks are held for one
+# window at a time and API traffic interleaves with the job. The checkpoint in BatchJobRuns
+# is advanced in the same transaction as the window, so a killed run resumes exactly after
+# the last committed window when started again with the same --as-of.
+
+RENEWAL_CHUNK_SIZE = getattr(config, "RENEWAL_CHUNK_SIZE", 5000)
+RENEWAL_PAUSE = getattr(config, "RENEWAL_PAUSE", 0.01)
+JOB_NAME = "subscription_renewals"
+
+_Bucket = namedtuple("_Bucket", "start_date end_date payment_method")
+
+def _plus_days(db: Session, column, days):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return func.date(column, literal("+") + days.cast(String) + literal(" days"))
+    if dialect == "mysql":
+        return func.adddate(column, days)
+    return column + days
+
+def _lapsed(as_of: date, low: int, high: int):
+    subscriptions = models.Subscriptions
+    return (
+        subscriptions.id_subscription > low,
+        subscriptions.id_subscription <= high,
+        subscriptions.status == "active",
+        subscriptions.end_date < as_of,
+    )
+
+def _renewable():
+    subscriptions = models.Subscriptions
+    return subscriptions.auto_renew.is_(True) & subscriptions.duration.is_not(None) & (subscriptions.duration > 0)
+
+# Extends the window's lapsed auto_renew subscriptions. The reporting summaries move each
+# renewed subscription from its old end_date bucket to the new one.
+def _renew(db: Session, as_of: date, low: int, high: int):
+    subscriptions = models.Subscriptions
+    where = (*_lapsed(as_of, low, high), _renewable())
+    columns = (subscriptions.start_date, subscriptions.end_date, subscriptions.duration, subscriptions.payment_method)
+    stmt = update(subscriptions).where(*where).values(end_date=_plus_days(db, subscriptions.end_date, subscriptions.duration))
+    if getattr(db.get_bind().dialect, "update_returning", False):
+        renewed = db.execute(stmt.returning(*columns), execution_options={"synchronize_session": False}).all()
+        old = [_Bucket(row.start_date, date.fromordinal(row.end_date.toordinal() - row.duration), row.payment_method) for row in renewed]
+        new = [_Bucket(row.start_date, row.end_date, row.payment_method) for row in renewed]
+    else:
+        rows = db.execute(select(*columns).where(*where)).all()
+        db.execute(stmt, execution_options={"synchronize_session": False})
+        old = [_Bucket(row.start_date, row.end_date, row.payment_method) for row in rows]
+        new = [_Bucket(row.start_date, date.fromordinal(row.end_date.toordinal() + row.duration), row.payment_method) for row in rows]
+    reporting.record(db, added=new, removed=old)
+    return len(old)
+
+def _expire(db: Session, as_of: date, low: int, high: int):
+    subscriptions = models.Subscriptions
+    stmt = update(subscriptions).where(*_lapsed(as_of, low, high), ~_renewable()).values(status="expired")
+    return db.execute(stmt, execution_options={"synchronize_session": False}).rowcount
+
+def _checkpoint(db: Session, as_of: date, restart: bool):
+    run = db.scalars(select(models.BatchJobRuns).where(models.BatchJobRuns.job == JOB_NAME, models.BatchJobRuns.as_of == as_of)).first()
+    if run is None:
+        run = models.BatchJobRuns(job=JOB_NAME, as_of=as_of, last_id=0, processed=0, renewed=0, expired=0, started_at=datetime.utcnow())
+        db.add(run)
+    elif restart:
+        run.last_id, run.processed, run.renewed, run.expired = 0, 0, 0, 0
+        run.started_at, run.finished_at = datetime.utcnow(), None
+    db.commit()
+    return run
+
+def run_renewals(as_of: date, chunk_size: int = RENEWAL_CHUNK_SIZE, pause: float = RENEWAL_PAUSE, restart: bool = False, progress=None):
+    init_engine()
+    db = SessionLocal()
+    try:
+        run = _checkpoint(db, as_of, restart)
+        if run.finished_at is not None:
+            return {"as_of": as_of, "status": "already finished", "processed": run.processed, "renewed": run.renewed, "expired": run.expired}
+        max_id = db.scalar(select(func.max(models.Subscriptions.id_subscription))) or 0
+        resumed_from = run.last_id
+        started = time.perf_counter()
+        while run.last_id < max_id:
+            low, high = run.last_id, min(run.last_id + chunk_size, max_id)
+            renewed = _renew(db, as_of, low, high)
+            expired = _expire(db, as_of, low, high)
+            if renewed or expired:
+                bump_versions(db, "Subscriptions")
+            run.last_id = high
+            run.processed += high - low
+            run.renewed += renewed
+            run.expired += expired
+            db.commit()
+            if progress is not None:
+                progress(run, run.last_id - resumed_from, time.perf_counter() - started)
+            if pause:
+                time.sleep(pause)
+        run.finished_at = datetime.utcnow()
+        db.commit()
+        elapsed = time.perf_counter() - started
+        scanned = run.last_id - resumed_from
+        return {
+            "as_of": as_of,
+            "status": "finished",
+            "resumed_from": resumed_from,
+            "processed": run.processed,
+            "renewed": run.renewed,
+            "expired": run.expired,
+            "seconds": round(elapsed, 2),
+            "ids_per_second": round(scanned / elapsed) if elapsed else None,
+        }
+    finally:
+        db.close()
+
+def _print_progress(every: int):
+    reported = {"ids": 0}
+    def progress(run, scanned, elapsed):
+        if scanned - reported["ids"] >= every:
+            reported["ids"] = scanned
+            print(f"  up to id {run.last_id}: {run.renewed} renewed, {run.expired} expired, {scanned / elapsed:.0f} ids/s")
+    return progress
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renew or expire every subscription that lapsed before a date")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date.today(), help="defaults to today")
+    parser.add_argument("--chunk-size", type=int, default=RENEWAL_CHUNK_SIZE, help="subscription ids per transaction")
+    parser.add_argument("--pause", type=float, default=RENEWAL_PAUSE, help="seconds to sleep between chunks")
+    parser.add_argument("--restart", action="store_true", help="start over instead of resuming an earlier run for the same date")
+    parser.add_argument("--progress-every", type=int, default=100000, help="print progress every N subscription ids, 0 for none")
+    args = parser.parse_args()
+    progress = _print_progress(args.progress_every) if args.progress_every else None
+    result = run_renewals(args.as_of, args.chunk_size, args.pause, args.restart, progress)
+    print(", ".join(f"{key}: {value}" for key, value in result.items()))
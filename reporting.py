@@ -0,0 +1,171 @@
+import argparse
+from collections import Counter
+from datetime import date, timedelta
+from sqlalchemy import delete, func, insert, literal, select, text, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import config, models
+
+# Subscription reports served from two summary tables instead of the Subscriptions table:
+#
+#   SubscriptionDailyStats   one row per day: subscriptions starting and ending that day
+#   SubscriptionMethodStats  one row per payment method: number of subscriptions
+#
+# The crud write paths keep them current in the same transaction as the change (record());
+# `python reporting.py --rebuild` recomputes both from scratch for backfills or repairs.
+# Subscriptions active on day D are the ones with start_date <= D <= end_date, i.e. all the
+# starts up to D minus all the ends before D, so the per-day series is a running sum over
+# the daily rows and no report ever reads more than one row per day or per method.
+
+REPORT_MAX_DAYS = getattr(config, "REPORT_MAX_DAYS", 366)
+
+#------
+#INCREMENTAL MAINTENANCE
+#------
+
+def _upsert(db: Session, model, key: str, rows: list):
+    columns = [name for name in rows[0] if name != key]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql if dialect == "postgresql" else sqlite).insert(model).values(rows)
+        table = model.__table__
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c[key]],
+            set_={name: table.c[name] + stmt.excluded[name] for name in columns},
+        ))
+        return
+    for row in rows:
+        pk = getattr(model, key)
+        changed = db.execute(
+            update(model).where(pk == row[key]).values({name: getattr(model, name) + row[name] for name in columns})
+        ).rowcount
+        if not changed:
+            db.execute(insert(model).values(row))
+
+# `added` and `removed` are subscription rows (ORM objects or Row tuples) with start_date,
+# end_date and payment_method. Deltas are merged per bucket first, so a write costs at
+# most one statement per summary table and an update that moves nothing costs none.
+def record(db: Session, added=(), removed=()):
+    started, ending, methods = Counter(), Counter(), Counter()
+    for rows, sign in ((added, 1), (removed, -1)):
+        for row in rows:
+            if row.start_date is not None:
+                started[row.start_date] += sign
+            if row.end_date is not None:
+                ending[row.end_date] += sign
+            if row.payment_method is not None:
+                methods[row.payment_method] += sign
+    days = sorted(day for day in started.keys() | ending.keys() if started[day] or ending[day])
+    if days:
+        _upsert(db, models.SubscriptionDailyStats, "day", [
+            {"day": day, "started": started[day], "ending": ending[day]} for day in days
+        ])
+    changed_methods = sorted(method for method, delta in methods.items() if delta)
+    if changed_methods:
+        _upsert(db, models.SubscriptionMethodStats, "payment_method", [
+            {"payment_method": method, "subscriptions": methods[method]} for method in changed_methods
+        ])
+
+#------
+#REBUILD
+#------
+
+# Recomputes both summary tables with two INSERT ... SELECT ... GROUP BY in one transaction.
+# On Postgres subscription writes wait for it (SHARE lock) so none is counted twice or lost;
+# SQLite already serializes writers. The Subscriptions version is bumped in the same
+# transaction, since the report ETags follow it.
+def rebuild(conn):
+    subscriptions = models.Subscriptions.__table__
+    daily = models.SubscriptionDailyStats.__table__
+    methods = models.SubscriptionMethodStats.__table__
+    if conn.dialect.name == "postgresql":
+        conn.execute(text('LOCK TABLE "Subscriptions" IN SHARE MODE'))
+    conn.execute(delete(daily))
+    conn.execute(delete(methods))
+    events = union_all(
+        select(subscriptions.c.start_date.label("day"), literal(1).label("started"), literal(0).label("ending"))
+        .where(subscriptions.c.start_date.is_not(None)),
+        select(subscriptions.c.end_date.label("day"), literal(0).label("started"), literal(1).label("ending"))
+        .where(subscriptions.c.end_date.is_not(None)),
+    ).subquery()
+    conn.execute(insert(daily).from_select(
+        ["day", "started", "ending"],
+        select(events.c.day, func.sum(events.c.started), func.sum(events.c.ending)).group_by(events.c.day),
+    ))
+    conn.execute(insert(methods).from_select(
+        ["payment_method", "subscriptions"],
+        select(subscriptions.c.payment_method, func.count())
+        .where(subscriptions.c.payment_method.is_not(None))
+        .group_by(subscriptions.c.payment_method),
+    ))
+    versions = models.TableVersions.__table__
+    conn.execute(update(versions).where(versions.c.name == "Subscriptions").values(version=versions.c.version + 1))
+
+#------
+#REPORTS
+#------
+
+def subscriptions_by_method(db: Session):
+    stats = models.SubscriptionMethodStats
+    rows = db.execute(
+        select(stats.payment_method, stats.subscriptions).where(stats.subscriptions != 0).order_by(stats.payment_method)
+    )
+    return [{"payment_method": method, "subscriptions": count} for method, count in rows]
+
+def _month(day: date):
+    return day.replace(day=1)
+
+# New and expiring subscriptions per calendar month between date_from and date_to
+def subscriptions_by_month(db: Session, date_from: date, date_to: date):
+    stats = models.SubscriptionDailyStats
+    rows = db.execute(
+        select(stats.day, stats.started, stats.ending)
+        .where(stats.day >= _month(date_from), stats.day <= date_to)
+        .order_by(stats.day)
+    )
+    months = {}
+    month = _month(date_from)
+    while month <= date_to:
+        months[month] = {"month": month, "new": 0, "expiring": 0}
+        month = (month + timedelta(days=32)).replace(day=1)
+    for day, started, ending in rows:
+        bucket = months[_month(day)]
+        bucket["new"] += started
+        bucket["expiring"] += ending
+    return list(months.values())
+
+# Active subscriptions on each day from date_from to date_to: the count on date_from comes
+# from one aggregate over the earlier buckets, then the range is walked once
+def active_by_day(db: Session, date_from: date, date_to: date):
+    stats = models.SubscriptionDailyStats
+    started_before, ended_before = db.execute(
+        select(func.coalesce(func.sum(stats.started), 0), func.coalesce(func.sum(stats.ending), 0))
+        .where(stats.day < date_from)
+    ).one()
+    rows = db.execute(select(stats.day, stats.started, stats.ending).where(stats.day >= date_from, stats.day <= date_to))
+    changes = {day: (started, ending) for day, started, ending in rows}
+    active = started_before - ended_before
+    series = []
+    day = date_from
+    ended_yesterday = 0
+    while day <= date_to:
+        started, ending = changes.get(day, (0, 0))
+        active += started - ended_yesterday
+        series.append({"day": day, "active": active})
+        ended_yesterday = ending
+        day += timedelta(days=1)
+    return series
+
+if __name__ == "__main__":
+    from database import get_engine
+
+    parser = argparse.ArgumentParser(description="Subscription reporting summary tables")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the summary tables from Subscriptions")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("nothing to do; pass --rebuild")
+    with get_engine().begin() as conn:
+        rebuild(conn)
+        days = conn.scalar(select(func.count()).select_from(models.SubscriptionDailyStats.__table__))
+        methods = conn.scalar(select(func.count()).select_from(models.SubscriptionMethodStats.__table__))
+    print(f"rebuilt {days} daily rows and {methods} payment method rows")
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
-from datetime import date, time
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from datetime import date, datetime, time
+from typing import Dict, Optional
 from typing import List
+from availability import local_datetime
 
 #Users schemas
 class UsersBase(BaseModel):
@@ -29,13 +30,22 @@ class TokenData(BaseModel):
     username: str | None = None
     
 #Clients schemas
+def normalize_cpf(cpf: str):
+    return "".join(ch for ch in cpf if ch.isdigit())
+
+def _validate_cpf(cpf: str):
+    cpf = normalize_cpf(cpf)
+    if len(cpf) != 11:
+        raise ValueError("CPF must have 11 digits")
+    return cpf
+
 class ClientBase(BaseModel):
     cpf: str
     name: str
     phone: str
 
 class ClientCreate(ClientBase):
-    pass
+    _normalize_cpf = field_validator("cpf")(_validate_cpf)
 
     class Config:
         from_attributes = True
@@ -50,6 +60,21 @@ class ClientUpdate(BaseModel):
     cpf: str
     name: str
     phone: str
+
+    _normalize_cpf = field_validator("cpf")(_validate_cpf)
+
+class ClientImportRow(BaseModel):
+    row: int
+    cpf: str | None = None
+    status: str
+    id_client: int | None = None
+    detail: str | None = None
+
+class ClientImportReport(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    rows: List[ClientImportRow]
         
 #Subscriptions schemas
 class SubscriptionsBase(BaseModel):
@@ -58,6 +83,7 @@ class SubscriptionsBase(BaseModel):
     payment_method: str
     end_date: date 
     id_client: int
+    auto_renew: bool = False
     
     class Config:
         from_attributes = True
@@ -70,6 +96,7 @@ class SubscriptionCreate(SubscriptionsBase):
 
 class SubscriptionRead(SubscriptionsBase):
     id_subscription: int
+    status: str = "active"
     
     class Config:
         from_attributes = True
@@ -95,6 +122,20 @@ class AdressRead(AdressBase):
     class Config:
         from_attributes = True
 
+#Client profile schema
+
+BATCH_MAX_IDS = 1000
+
+class ClientIds(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=BATCH_MAX_IDS)
+
+class ClientProfile(ClientRead):
+    adresses: List[AdressRead] = []
+    subscriptions: List[SubscriptionRead] = []
+
+    class Config:
+        from_attributes = True
+
 #Barber Schemas
 
 class BarberBase(BaseModel):
@@ -112,6 +153,50 @@ class BarberRead(BarberBase):
     class Config:
         from_attributes = True
 
+#Appointment schemas
+
+class AppointmentBase(BaseModel):
+    id_barber: int
+    id_client: int
+    start_at: datetime
+    end_at: datetime
+
+    _local_times = field_validator("start_at", "end_at")(local_datetime)
+
+class AppointmentCreate(AppointmentBase):
+    pass
+
+    class Config:
+        from_attributes = True
+
+class AppointmentRead(AppointmentBase):
+    id_appointment: int
+
+    class Config:
+        from_attributes = True
+
+# Free slot start times per barber; each slot lasts `duration` minutes
+class Availability(BaseModel):
+    date_from: date
+    date_to: date
+    duration: int
+    slots: Dict[int, List[datetime]]
+
+#Report schemas
+
+class PaymentMethodReport(BaseModel):
+    payment_method: str
+    subscriptions: int
+
+class MonthlySubscriptionsReport(BaseModel):
+    month: date
+    new: int
+    expiring: int
+
+class DailyActiveReport(BaseModel):
+    day: date
+    active: int
+
 #users_clients associative schema
 
 # class UsersClientBase(BaseModel):
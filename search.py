@@ -0,0 +1,200 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+import config, models
+from database import SessionLocal
+from models import search_key
+
+SEARCH_SIMILARITY_THRESHOLD = getattr(config, "SEARCH_SIMILARITY_THRESHOLD", 0.3)
+# Each worker keeps its own index (see NGramIndex): a client written through another worker
+# or process only shows up in this worker's searches after its next rebuild, so results can
+# lag the table by up to SEARCH_INDEX_TTL seconds
+SEARCH_INDEX_TTL = getattr(config, "SEARCH_INDEX_TTL", 300)
+
+# Same trigram split as pg_trgm: each word padded with two leading and one trailing space
+def trigrams(text: str):
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _is_word_prefix(key: str, query: str):
+    return key.startswith(query) or f" {query}" in key
+
+# In-process trigram inverted index over Clients.name_search, used where pg_trgm is not
+# available. It is built at startup (warm_index, from main's lifespan), kept current by this
+# worker's client write paths in crud and fully rebuilt every SEARCH_INDEX_TTL seconds to pick
+# up rows written by other workers; until then those rows are missing or stale here.
+class NGramIndex:
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._keys = {}
+        self._sizes = {}
+        self._built_at = None
+        self._rebuilding = False
+        # Writes made while a build is reading the table, replayed onto its snapshot before the swap
+        self._builds = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    # Builds inline when warm_index did not run (scripts, an app without its lifespan);
+    # later TTL refreshes run in a background thread while searches keep using the previous index
+    def ensure(self, db: Session):
+        if self._built_at is None:
+            self._build(db)
+            return
+        with self._lock:
+            if time.monotonic() - self._built_at < SEARCH_INDEX_TTL or self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        db = SessionLocal()
+        try:
+            self._build(db)
+        finally:
+            db.close()
+            with self._lock:
+                self._rebuilding = False
+
+    def _build(self, db: Session):
+        with self._lock:
+            self._builds += 1
+        try:
+            rows = db.execute(
+                select(models.Clients.id_client, models.Clients.name_search).execution_options(yield_per=10000)
+            )
+            postings, keys, sizes = defaultdict(set), {}, {}
+            for id_client, key in rows:
+                grams = trigrams(key or "")
+                keys[id_client] = key or ""
+                sizes[id_client] = len(grams)
+                for gram in grams:
+                    postings[gram].add(id_client)
+            with self._lock:
+                self._postings, self._keys, self._sizes = postings, keys, sizes
+                for id_client, key in self._pending:
+                    self._discard(id_client)
+                    if key is not None:
+                        self._index(id_client, key)
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._builds -= 1
+                if not self._builds:
+                    self._pending = []
+
+    def add(self, id_client: int, key: str | None):
+        with self._lock:
+            if self._builds:
+                self._pending.append((id_client, key or ""))
+            if self._built_at is None:
+                return
+            self._discard(id_client)
+            self._index(id_client, key or "")
+
+    def remove(self, id_client: int):
+        with self._lock:
+            if self._builds:
+                self._pending.append((id_client, None))
+            if self._built_at is not None:
+                self._discard(id_client)
+
+    def _index(self, id_client: int, key: str):
+        grams = trigrams(key)
+        self._keys[id_client] = key
+        self._sizes[id_client] = len(grams)
+        for gram in grams:
+            self._postings[gram].add(id_client)
+
+    def _discard(self, id_client: int):
+        key = self._keys.pop(id_client, None)
+        self._sizes.pop(id_client, None)
+        if key is None:
+            return
+        for gram in trigrams(key):
+            self._postings[gram].discard(id_client)
+
+    # A match needs `need` shared trigrams, so it must appear in at least one of the
+    # len(lists) - need + 1 shortest posting lists; only those are scanned for candidates.
+    # Word-prefix matches share all but at most one trigram and always survive the cut.
+    # Only the copy of the query's posting lists is taken under the lock; scoring runs on
+    # that snapshot so writes and other searches are not held up by it.
+    def search(self, query: str, limit: int, offset: int = 0):
+        query_grams = trigrams(query)
+        with self._lock:
+            lists = sorted((set(self._postings.get(gram, ())) for gram in query_grams), key=len)
+            keys, sizes = self._keys, self._sizes
+        need = max(1, min(math.ceil(SEARCH_SIMILARITY_THRESHOLD * len(lists)), len(lists) - 1))
+        candidates = set().union(*lists[:len(lists) - need + 1])
+        ranked = []
+        for id_client in candidates:
+            shared = sum(1 for posting in lists if id_client in posting)
+            key, size = keys.get(id_client), sizes.get(id_client)
+            # Removed or renamed since the snapshot
+            if key is None or size is None or size < shared:
+                continue
+            similarity = shared / (len(query_grams) + size - shared)
+            prefix = _is_word_prefix(key, query)
+            if prefix or similarity >= SEARCH_SIMILARITY_THRESHOLD:
+                ranked.append((not prefix, -similarity, id_client))
+        ranked.sort()
+        return [id_client for _, _, id_client in ranked[offset:offset + limit]]
+
+    def clear(self):
+        with self._lock:
+            self._postings, self._keys, self._sizes = defaultdict(set), {}, {}
+            self._built_at = None
+
+client_index = NGramIndex()
+
+# Called from main's lifespan so the first search does not pay for reading the whole table
+def warm_index():
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            client_index.ensure(db)
+    finally:
+        db.close()
+
+def index_client(db_client: models.Clients):
+    client_index.add(db_client.id_client, db_client.name_search)
+
+def unindex_client(client_id: int):
+    client_index.remove(client_id)
+
+#------
+#CLIENT SEARCH
+#------
+
+# Postgres: prefix matches first, then pg_trgm similarity; every predicate is served by the GIN trigram index
+def _search_trgm(db: Session, query: str, limit: int, offset: int):
+    name_search = models.Clients.name_search
+    prefix = name_search.startswith(query, autoescape=True)
+    word_prefix = name_search.contains(f" {query}", autoescape=True)
+    return (
+        db.query(models.Clients)
+        .filter(or_(prefix, word_prefix, name_search.op("%")(query)))
+        .order_by(case((prefix, 0), (word_prefix, 1), else_=2), func.similarity(name_search, query).desc(), models.Clients.id_client)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+def search_clients(db: Session, name: str, limit: int, offset: int = 0):
+    query = search_key(name)
+    if not query:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _search_trgm(db, query, limit, offset)
+    client_index.ensure(db)
+    ids = client_index.search(query, limit, offset)
+    if not ids:
+        return []
+    clients = {c.id_client: c for c in db.query(models.Clients).filter(models.Clients.id_client.in_(ids))}
+    return [clients[i] for i in ids if i in clients]
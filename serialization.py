@@ -0,0 +1,61 @@
+from fastapi import Response
+from pydantic import TypeAdapter, ValidationError
+
+# List endpoints return ORM rows through this instead of letting FastAPI handle them:
+# each row is validated once against the read schema (from attributes, in pydantic-core)
+# and dumped straight to JSON bytes, skipping the response_model re-validation,
+# jsonable_encoder pass and stdlib json.dumps. Handlers keep response_model for the docs.
+
+_adapters = {}
+
+def _adapter(type_):
+    adapter = _adapters.get(type_)
+    if adapter is None:
+        adapter = _adapters[type_] = TypeAdapter(type_)
+    return adapter
+
+_fields = {}
+
+# Loaded ORM instances keep their column values in __dict__, and validating plain dicts is
+# about twice as fast as reading instrumented attributes. Expired, deferred or unloaded
+# columns are simply absent from __dict__, and a dict missing them would validate to the
+# schema defaults (status="active", auto_renew=False) instead of the stored values, so
+# those rows are passed as-is and read from attributes, which loads them.
+def _row_dicts(schema, rows):
+    names = _fields.get(schema)
+    if names is None:
+        names = _fields[schema] = frozenset(schema.model_fields)
+    return [row.__dict__ if names <= row.__dict__.keys() else row for row in rows]
+
+def dump_list(schema, rows):
+    adapter = _adapter(list[schema])
+    try:
+        items = adapter.validate_python(_row_dicts(schema, rows), from_attributes=True)
+    except (AttributeError, ValidationError):
+        items = adapter.validate_python(rows, from_attributes=True)
+    return adapter.dump_json(items)
+
+# Same for {id: [rows]} groupings, e.g. subscriptions keyed by client
+def dump_groups(schema, groups: dict):
+    adapter = _adapter(dict[int, list[schema]])
+    try:
+        items = adapter.validate_python({key: _row_dicts(schema, rows) for key, rows in groups.items()}, from_attributes=True)
+    except (AttributeError, ValidationError):
+        items = adapter.validate_python(groups, from_attributes=True)
+    return adapter.dump_json(items)
+
+def _json_response(body: bytes, response: Response | None):
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# `response` is the handler's injected Response; headers set on it (X-Next-Cursor) are carried over
+def list_response(schema, rows, response: Response | None = None):
+    return _json_response(dump_list(schema, rows), response)
+
+def groups_response(schema, groups: dict, response: Response | None = None):
+    return _json_response(dump_groups(schema, groups), response)
+
+# A single response built from plain dicts and lists, e.g. the availability grid
+def model_response(schema, data: dict, response: Response | None = None):
+    adapter = _adapter(schema)
+    return _json_response(adapter.dump_json(adapter.validate_python(data)), response)
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# Point the app at a throwaway SQLite file before anything reads the database settings
+DB_DIR = tempfile.mkdtemp()
+config.SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'test.db')}"
+config.DB_ASYNC = False
+config.DB_REPLICA_URL = None
+
+import pytest
+from fastapi.testclient import TestClient
+import main, migrations, models, auth, database
+
+# One migrated database for the session: user tester/secret, barber 1 and client 1
+@pytest.fixture(scope="session")
+def client():
+    migrations.upgrade()
+    with database.SessionLocal() as db:
+        db.add(models.Users(login="tester", hashed_password=auth.get_password_hash("secret"), position="test"))
+        db.add(models.Barber(name="Barbeiro"))
+        db.add(models.Clients(cpf="00000000001", name="Cliente", phone="21999999999"))
+        db.commit()
+    with TestClient(main.app) as test_client:
+        token = test_client.post("/login", data={"username": "tester", "password": "secret"}).json()["access_token"]
+        test_client.headers["Authorization"] = f"Bearer {token}"
+        yield test_client
@@ -0,0 +1,22 @@
+from datetime import datetime
+import schemas
+from availability import check_interval
+
+def test_aware_timestamps_become_local_time():
+    appointment = schemas.AppointmentCreate(id_barber=1, id_client=1, start_at="2026-10-20T13:00:00Z", end_at="2026-10-20T10:30:00-03:00")
+    assert appointment.start_at == datetime(2026, 10, 20, 10, 0)
+    assert appointment.end_at == datetime(2026, 10, 20, 10, 30)
+    assert check_interval(datetime.fromisoformat("2026-10-20T13:00:00+00:00"), appointment.end_at) is None
+
+def test_booking_with_offset(client):
+    response = client.post("/appointments/", json={"id_barber": 1, "id_client": 1, "start_at": "2026-10-20T10:00:00-03:00", "end_at": "2026-10-20T10:30:00-03:00"})
+    assert response.status_code == 200
+    assert response.json()["start_at"] == "2026-10-20T10:00:00"
+    # The same slot written in UTC overlaps it
+    response = client.post("/appointments/", json={"id_barber": 1, "id_client": 1, "start_at": "2026-10-20T13:00:00Z", "end_at": "2026-10-20T13:30:00Z"})
+    assert response.status_code == 409
+
+def test_listing_with_aware_bounds(client):
+    response = client.get("/appointments/", params={"start": "2026-10-20T12:00:00Z", "end": "2026-10-20T14:00:00Z"})
+    assert response.status_code == 200
+    assert [row["start_at"] for row in response.json()] == ["2026-10-20T10:00:00"]
@@ -0,0 +1,105 @@
+import sqlite3
+import pytest
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import config, database, dependencies, main
+from dependencies import PRIMARY_PIN_COOKIE
+
+# The session database is the primary; each test points the app at a replica file of its
+# own. A snapshot of the primary taken before the test's writes tells the two apart: rows
+# written during the test are only visible on the primary.
+
+def use_replica(monkeypatch, url: str):
+    engine, _ = database._create_engines(url, None, read_only=True, pool_pre_ping=True)
+    monkeypatch.setattr(database, "DB_REPLICA_URL", url)
+    monkeypatch.setattr(dependencies, "DB_REPLICA_URL", url)
+    monkeypatch.setattr(database, "replica_engine", engine)
+    monkeypatch.setitem(database.ReplicaSessionLocal.kw, "bind", engine)
+    monkeypatch.setattr(database, "replica_health", database.ReplicaHealth(database.DB_REPLICA_RETRY_SECONDS))
+    return engine
+
+@pytest.fixture
+def replica_url(client, tmp_path):
+    path = tmp_path / "replica.db"
+    primary = sqlite3.connect(config.SQLALCHEMY_DATABASE_URL.split(":///", 1)[1])
+    replica = sqlite3.connect(path)
+    primary.backup(replica)
+    primary.close()
+    replica.close()
+    return f"sqlite:///{path}"
+
+@pytest.fixture
+def replica(client, monkeypatch, replica_url):
+    client.cookies.clear()
+    engine = use_replica(monkeypatch, replica_url)
+    yield engine
+    client.cookies.clear()
+    engine.dispose()
+
+def barber_names(client):
+    response = client.get("/barber/")
+    assert response.status_code == 200
+    return [barber["name"] for barber in response.json()]
+
+def test_get_reads_from_replica(client, replica):
+    assert client.post("/barber/", json={"name": "Só no primário"}).status_code == 200
+    client.cookies.clear()
+    assert "Só no primário" not in barber_names(client)
+    assert database.replica_health.reads == 1 and database.replica_health.fallbacks == 0
+
+def test_write_pins_next_read_to_primary(client, replica):
+    response = client.post("/barber/", json={"name": "Recém-criado"})
+    assert response.status_code == 200
+    assert PRIMARY_PIN_COOKIE in response.cookies
+    assert "Recém-criado" in barber_names(client)
+    assert database.replica_health.reads == 0
+
+@pytest.mark.parametrize("request_args", [
+    ("/login", {"data": {"username": "tester", "password": "secret"}}),
+    ("/clients/batch", {"json": {"ids": [1]}}),
+])
+def test_read_only_posts_do_not_pin(client, replica, request_args):
+    path, kwargs = request_args
+    response = client.post(path, **kwargs)
+    assert response.status_code == 200
+    assert PRIMARY_PIN_COOKIE not in response.cookies
+
+READ_ONLY_POSTS = {"/login", "/clients/batch", "/clients/batch/profiles", "/subscriptions/by-clients", "/adress/by-clients"}
+
+# Some of these answer with their own Response, which would drop the cookie anyway, so the
+# exclusion is also checked against every POST route directly
+def test_only_read_only_posts_skip_the_pin():
+    routes = {route.path: route for route in main.app.routes if "POST" in getattr(route, "methods", ())}
+    assert READ_ONLY_POSTS <= routes.keys()
+    for path, route in routes.items():
+        request = Request({"type": "http", "method": "POST", "headers": [], "route": route})
+        assert dependencies._writes(request) == (path not in READ_ONLY_POSTS), path
+
+@pytest.mark.parametrize("contents", [None, b"not a database, just some text that is long enough"])
+def test_broken_replica_falls_back(client, monkeypatch, tmp_path, contents):
+    path = tmp_path / "replica.db"
+    if contents is not None:
+        path.write_bytes(contents)
+    client.cookies.clear()
+    engine = use_replica(monkeypatch, f"sqlite:///{path}")
+    try:
+        assert "Barbeiro" in barber_names(client)
+        health = database.replica_health
+        assert (health.reads, health.fallbacks, health.failures) == (0, 1, 1)
+        assert not health.available()
+        # Skipped for the retry window: no second connection attempt
+        barber_names(client)
+        assert (health.fallbacks, health.failures) == (2, 1)
+        assert path.exists() == (contents is not None)
+    finally:
+        engine.dispose()
+
+def test_replica_session_refuses_writes(replica):
+    db = database.open_read_session()
+    try:
+        assert db.get_bind() is replica
+        with pytest.raises(OperationalError, match="readonly"):
+            db.execute(text('UPDATE "Barber" SET name = name'))
+    finally:
+        db.close()
@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+import database
+from benchmark import WRITE_STATEMENT_BUDGET, WRITE_STATEMENT_BUDGET_OVERRIDES
+
+# Write routes stay within the statement budgets benchmark.py --check-statements enforces,
+# on the 404 paths too. The principal cache is warm after the first request, so only the
+# route's own statements are counted.
+
+@contextmanager
+def count_statements():
+    engine = database.get_request_engine()
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+def call(client, route: str, path: str, status: int = 200, **kwargs):
+    method = route.split()[0]
+    with count_statements() as statements:
+        response = client.request(method, path, **kwargs)
+    assert response.status_code == status, response.text
+    budget = WRITE_STATEMENT_BUDGET_OVERRIDES.get(route, WRITE_STATEMENT_BUDGET)
+    assert len(statements) <= budget, f"{route}: {len(statements)} statements, budget {budget}: {statements}"
+    return response.json()
+
+def new_client(client, cpf: str):
+    return call(client, "POST /register_client", "/register_client", json={"cpf": cpf, "name": "Cliente", "phone": "21999999999"})
+
+def subscription(id_client: int, **values):
+    return {"start_date": "2026-10-01", "duration": 30, "payment_method": "pix", "end_date": "2026-10-31", "id_client": id_client, **values}
+
+def adress(id_client: int):
+    return {"logradouro": "Rua A", "number": "1", "neighborhood": "Centro", "city": "Rio", "complement": "", "id_client": id_client}
+
+@pytest.fixture(autouse=True)
+def warm_principal(client):
+    client.get("/me")
+
+def test_client_writes(client):
+    created = new_client(client, "10000000001")
+    call(client, "POST /register_client", "/register_client", 400, json={"cpf": "10000000001", "name": "Outro", "phone": "21999999999"})
+    call(client, "PUT /client", "/client", json={"cpf": "10000000001", "name": "Renomeado", "phone": "21999999999"})
+    body = {"cpf": "10000000001", "name": "Cliente", "phone": "21888888888"}
+    assert call(client, "PATCH /client/{client_id}", f"/client/{created['id_client']}", json=body)["phone"] == "21888888888"
+    call(client, "PATCH /client/{client_id}", "/client/999999", 404, json=body)
+    call(client, "DELETE /client/{client_id}", f"/client/{created['id_client']}")
+    call(client, "DELETE /client/{client_id}", f"/client/{created['id_client']}", 404)
+
+def test_subscription_writes(client):
+    id_client = new_client(client, "10000000002")["id_client"]
+    created = call(client, "POST /subscriptions", "/subscriptions", json=subscription(id_client, auto_renew=True))
+    call(client, "POST /subscriptions", "/subscriptions", 400, json=subscription(999999))
+    # auto_renew is not sent, so exclude_unset leaves the stored value alone
+    updated = call(client, "PATCH /subscription/{subscription_id}", f"/subscription/{created['id_subscription']}", json=subscription(id_client, payment_method="cartao"))
+    assert updated["payment_method"] == "cartao" and updated["auto_renew"] is True
+    call(client, "PATCH /subscription/{subscription_id}", "/subscription/999999", 404, json=subscription(id_client))
+    call(client, "DELETE /subscriptions/{subscription_id}", f"/subscriptions/{created['id_subscription']}")
+    call(client, "DELETE /subscriptions/{subscription_id}", f"/subscriptions/{created['id_subscription']}", 404)
+
+def test_adress_writes(client):
+    id_client = new_client(client, "10000000003")["id_client"]
+    created = call(client, "POST /adress", "/adress", json=adress(id_client))
+    call(client, "POST /adress", "/adress", 400, json=adress(999999))
+    assert call(client, "PATCH /adress/{adress_id}", f"/adress/{created['id_adress']}", json={**adress(id_client), "number": "2"})["number"] == "2"
+    call(client, "PATCH /adress/{adress_id}", "/adress/999999", 404, json=adress(id_client))
+    call(client, "DELETE /adress/{adress_id}", f"/adress/{created['id_adress']}")
+    call(client, "DELETE /adress/{adress_id}", f"/adress/{created['id_adress']}", 404)
+
+def test_barber_and_appointment_writes(client):
+    id_barber = call(client, "POST /barber/", "/barber/", json={"name": "Novo"})["id_barber"]
+    assert call(client, "PATCH /barber/{barber_id}", f"/barber/{id_barber}", json={"name": "Renomeado"})["name"] == "Renomeado"
+    call(client, "PATCH /barber/{barber_id}", "/barber/999999", 404, json={"name": "Nenhum"})
+    booking = {"id_barber": id_barber, "id_client": 1, "start_at": "2026-11-03T10:00:00", "end_at": "2026-11-03T10:30:00"}
+    id_appointment = call(client, "POST /appointments/", "/appointments/", json=booking)["id_appointment"]
+    call(client, "POST /appointments/", "/appointments/", 409, json=booking)
+    call(client, "POST /appointments/", "/appointments/", 404, json={**booking, "id_barber": 999999})
+    call(client, "POST /appointments/", "/appointments/", 400, json={**booking, "id_client": 999999, "start_at": "2026-11-03T11:00:00", "end_at": "2026-11-03T11:30:00"})
+    call(client, "DELETE /appointments/{appointment_id}", f"/appointments/{id_appointment}")
+    call(client, "DELETE /appointments/{appointment_id}", f"/appointments/{id_appointment}", 404)
+    call(client, "DELETE /barber/{barber_id}", f"/barber/{id_barber}")
+    call(client, "DELETE /barber/{barber_id}", f"/barber/{id_barber}", 404)